@@ -93,14 +93,30 @@ def cache_delete(key_prefix: str, *key_args):
         logger.warning(f"Cache delete error: {e}")
 
 
-def cache_rag_result(question: str, top_k: int, use_enhanced: bool, result: dict, ttl: int = 3600):
-    """Cache RAG result."""
-    cache_set("rag:result", result, ttl, question, top_k, use_enhanced)
-
-
-def get_cached_rag_result(question: str, top_k: int, use_enhanced: bool) -> Optional[dict]:
+def question_hash(question: str) -> str:
+    """Stable, compact cache-key component for a question (BLAKE2b-128 hex)."""
+    return hashlib.blake2b(question.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def cache_rag_result(
+    question: str,
+    top_k: int,
+    use_enhanced: bool,
+    result: dict,
+    ttl: int = 3600,
+    qhash: Optional[str] = None,
+):
+    """Cache RAG result. Pass qhash to reuse an already computed question_hash."""
+    qhash = qhash or question_hash(question)
+    cache_set("rag:result", result, ttl, qhash, top_k, use_enhanced)
+
+
+def get_cached_rag_result(
+    question: str, top_k: int, use_enhanced: bool, qhash: Optional[str] = None
+) -> Optional[dict]:
     """Get cached RAG result."""
-    return cache_get("rag:result", question, top_k, use_enhanced)
+    qhash = qhash or question_hash(question)
+    return cache_get("rag:result", qhash, top_k, use_enhanced)
 
 
 def cache_embedding(text: str, embedding: list, ttl: int = 86400):
@@ -113,14 +129,22 @@ def get_cached_embedding(text: str) -> Optional[list]:
     return cache_get("embedding", text)
 
 
-def cache_classification(question: str, domain: str, confidence: float, ttl: int = 3600):
+def cache_classification(
+    question: str,
+    domain: str,
+    confidence: float,
+    ttl: int = 3600,
+    qhash: Optional[str] = None,
+):
     """Cache question classification."""
-    cache_set("classification", {"domain": domain, "confidence": confidence}, ttl, question)
+    qhash = qhash or question_hash(question)
+    cache_set("classification", {"domain": domain, "confidence": confidence}, ttl, qhash)
 
 
-def get_cached_classification(question: str) -> Optional[dict]:
+def get_cached_classification(question: str, qhash: Optional[str] = None) -> Optional[dict]:
     """Get cached classification."""
-    return cache_get("classification", question)
+    qhash = qhash or question_hash(question)
+    return cache_get("classification", qhash)
 
 
 
@@ -8,6 +8,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent.parent
 PERSIST_DIRECTORY = Path(
     os.getenv("CHROMA_DB_DIR", BASE_DIR / "storage" / "chroma")
 ).as_posix()
+# Optional Chroma server (`chroma run --path ...`); empty = embedded PersistentClient
+CHROMA_HOST = os.getenv("CHROMA_HOST", "")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
 UPLOAD_DIRECTORY = Path(os.getenv("UPLOAD_DIR", BASE_DIR / "data" / "uploads"))
 UPLOAD_DIRECTORY.mkdir(parents=True, exist_ok=True)
 
@@ -18,6 +21,26 @@ SQLALCHEMY_DATABASE_URL = os.getenv(
 
 # Embeddings
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "intfloat/multilingual-e5-base")
+# Texts per forward pass when precomputing embeddings during ingestion
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# Run the embedding model as an int8-quantized ONNX graph on CPU
+# (requires `pip install optimum[onnxruntime]`; falls back to PyTorch otherwise)
+EMBEDDING_INT8_ONNX = os.getenv("EMBEDDING_INT8_ONNX", "false").lower() in (
+    "1",
+    "true",
+)
+# Documents per Chroma insert batch (Chroma's hard limit is ~5461)
+CHROMA_BATCH_SIZE = int(os.getenv("CHROMA_BATCH_SIZE", "256"))
+# Measure a few batch sizes on the first large ingest and reuse the fastest
+CHROMA_AUTOTUNE_BATCH = os.getenv("CHROMA_AUTOTUNE_BATCH", "false").lower() in (
+    "1",
+    "true",
+)
+# HNSW ef_search applied by set_search_ef() once bulk ingestion is finished
+# (Chroma's default is 100; higher = better recall, slower queries)
+CHROMA_SEARCH_EF = int(os.getenv("CHROMA_SEARCH_EF", "200"))
+# Persist the vector store every N ingest batches (plus once at the end)
+CHROMA_PERSIST_EVERY = int(os.getenv("CHROMA_PERSIST_EVERY", "10"))
 HF_TIMEOUT = int(
     os.getenv("HF_TIMEOUT", "120")
 )  # Timeout for Hugging Face downloads (seconds)
@@ -30,10 +53,20 @@ OLLAMA_MODEL = os.getenv("OLLAMA_MODEL")
 DEFAULT_TOP_K = int(os.getenv("DEFAULT_TOP_K", "5"))
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "800"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "120"))
+# Approximate character budget for retrieved context passed to the LLM
+MAX_CONTEXT_CHARS = int(os.getenv("MAX_CONTEXT_CHARS", "8000"))
 
 # Reranker
 RERANKER_ENABLED = os.getenv("RERANKER_ENABLED", "true").lower() == "true"
 RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Seconds to wait before retrying a failed reranker model load
+RERANKER_RETRY_INTERVAL = int(os.getenv("RERANKER_RETRY_INTERVAL", "300"))
+# "auto" uses CUDA (fp16) when available, otherwise CPU; or set "cpu"/"cuda"
+RERANKER_DEVICE = os.getenv("RERANKER_DEVICE", "auto").lower()
+if RERANKER_DEVICE not in ("auto", "cpu", "cuda"):
+    raise ValueError(
+        f"Invalid RERANKER_DEVICE '{RERANKER_DEVICE}'. Use one of: auto, cpu, cuda"
+    )
 
 # Auth
 SECRET_KEY = os.getenv("SECRET_KEY", "change-this-secret")
@@ -46,6 +79,9 @@ ALLOWED_ORIGINS = os.getenv(
     "http://localhost:3000,http://localhost:8000,http://127.0.0.1:3000,http://127.0.0.1:8000",
 ).split(",")
 
+# Responses at least this many bytes are gzip-compressed for clients that accept it
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1000"))
+
 # Redis
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 REDIS_ENABLED = os.getenv("REDIS_ENABLED", "false").lower() == "true"
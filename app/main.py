@@ -3,6 +3,7 @@ import os
 
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse
 
 from app.routes.auth import router as auth_router
@@ -11,7 +12,7 @@ from app.routes.conversation import router as conversation_router
 from app.core.database import Base, engine
 from app.core.logging import configure_logging
 from app.core.monitoring import init_sentry
-from app.core.config import ALLOWED_ORIGINS
+from app.core.config import ALLOWED_ORIGINS, GZIP_MIN_SIZE
 from app.core.rate_limit import setup_rate_limiting
 
 # Import models to ensure they are registered in metadata
@@ -85,6 +86,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Answers and source listings are large, highly compressible JSON
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE)
 
 
 @app.get("/health")
@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 from sqlalchemy.orm import Session
 import zipfile
 import shutil
@@ -22,7 +22,14 @@ from app.services.folder_ingestion import (
     ingest_zip_folder,
     find_word_files_in_folder,
 )
-from app.services.vectorstore import add_documents, stats, get_stored_sources
+from app.services.vectorstore import (
+    add_documents,
+    stats,
+    get_stored_sources,
+    get_chroma_client,
+    reset_cache,
+    set_search_ef,
+)
 from app.services.rag import build_rag_chain
 from app.schemas.rag import (
     AskRequest,
@@ -216,12 +223,15 @@ async def upload_folder_zip(zip_file: UploadFile = File(...)):
 async def upload_folder_from_path(
     folder_path: str = Body(..., embed=True),
     recursive: bool = Body(True, embed=True),
+    files: Optional[List[str]] = Body(None, embed=True),
 ):
     """
     پردازش فولدر از مسیر محلی سرور و اضافه کردن همه فایل‌های Word آن به vectordb.
 
     این endpoint برای زمانی است که فایل‌ها از قبل در سرور موجود هستند.
     مسیر می‌تواند نسبی به BASE_DIR یا مطلق باشد.
+    اگر files (مسیرهای نسبی داخل فولدر) داده شود، فقط همان فایل‌ها پردازش
+    می‌شوند و فولدر پیمایش نمی‌شود.
     """
     # تبدیل مسیر به Path
     folder = Path(folder_path)
@@ -241,7 +251,7 @@ async def upload_folder_from_path(
 
     # پردازش فایل‌های Word
     try:
-        documents = ingest_folder(folder, recursive=recursive)
+        documents = ingest_folder(folder, recursive=recursive, files=files)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"خطا در پردازش فولدر: {str(e)}")
 
@@ -436,6 +446,21 @@ async def ask(
         raise HTTPException(status_code=500, detail=f"خطا در پردازش سوال: {str(e)}")
 
 
+@router.post("/tune-search")
+async def tune_search(collection_name: str = "legal-texts"):
+    """Switch a collection's HNSW index to query-oriented parameters.
+
+    Call once after a bulk ingest (e.g. at the end of the batch upload scripts).
+    """
+    import asyncio
+
+    try:
+        hnsw = await asyncio.to_thread(set_search_ef, collection_name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to tune collection: {e}")
+    return {"status": "success", "collection": collection_name, "hnsw": hnsw}
+
+
 @router.delete("/reset")
 def reset_collection(collection_name: str = "legal-texts"):
     """Reset/delete a ChromaDB collection (useful for fixing corruption)."""
@@ -444,12 +469,10 @@ def reset_collection(collection_name: str = "legal-texts"):
     logger = logging.getLogger(__name__)
 
     try:
-        import chromadb
-        from app.core.config import PERSIST_DIRECTORY
-
-        client = chromadb.PersistentClient(path=PERSIST_DIRECTORY)
+        client = get_chroma_client()
         try:
             client.delete_collection(collection_name)
+            reset_cache(collection_name)
             logger.info(f"Deleted collection: {collection_name}")
             return {
                 "status": "success",
@@ -1,6 +1,6 @@
 import zipfile
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 from langchain_core.documents import Document
 
@@ -62,18 +62,38 @@ def extract_word_files_from_zip(zip_path: Path, extract_to: Path) -> List[Path]:
     return word_files
 
 
-def ingest_folder(folder_path: Path, recursive: bool = True) -> List[Document]:
+def _listed_word_files(folder_path: Path, files: List[str]) -> List[Path]:
+    """Word files named (relative to folder_path) by the caller, without
+    scanning the folder. Names that escape the folder are ignored."""
+    root = folder_path.resolve()
+    word_files: List[Path] = []
+    for name in files:
+        file_path = folder_path / name
+        if file_path.suffix.lower() not in {".docx", ".doc"}:
+            continue
+        if not file_path.resolve().is_relative_to(root) or not file_path.is_file():
+            continue
+        word_files.append(file_path)
+    return word_files
+
+
+def ingest_folder(
+    folder_path: Path, recursive: bool = True, files: Optional[List[str]] = None
+) -> List[Document]:
     """
     پردازش تمام فایل‌های Word در یک فولدر و تبدیل به Documents.
 
     Args:
         folder_path: مسیر فولدر
         recursive: آیا در زیرفولدرها هم جستجو شود
+        files: فهرست فایل‌ها (نسبت به فولدر)؛ اگر داده شود فولدر پیمایش نمی‌شود
 
     Returns:
         لیست Documents
     """
-    if recursive:
+    if files is not None:
+        word_files = _listed_word_files(folder_path, files)
+    elif recursive:
         word_files = find_word_files_in_folder(folder_path)
     else:
         # فقط فایل‌های مستقیم در فولدر
@@ -6,6 +6,8 @@ import re
 from enum import Enum
 from typing import Optional
 
+import numpy as np
+
 # Legal domain categories
 LEGAL_DOMAINS = {
     "criminal": {
@@ -87,6 +89,18 @@ LEGAL_DOMAINS = {
 }
 
 
+# Keyword matrix: rows = domains, columns = keywords (flattened across domains,
+# so a keyword shared by two domains gets a column in each). Hit counts per
+# domain are one matrix-vector product over the keyword presence vector.
+_DOMAIN_KEYS = list(LEGAL_DOMAINS)
+_KWS = [kw for info in LEGAL_DOMAINS.values() for kw in info["keywords"]]
+_KW_DOMAIN = np.array(
+    [row for row, info in enumerate(LEGAL_DOMAINS.values()) for _ in info["keywords"]]
+)
+_KW_MATRIX = (np.arange(len(_DOMAIN_KEYS))[:, None] == _KW_DOMAIN).astype(np.float64)
+_DOMAIN_SIZES = _KW_MATRIX.sum(axis=1)
+
+
 class LegalDomain(str, Enum):
     """Legal domain categories."""
 
@@ -104,10 +118,12 @@ def classify_question(question: str) -> tuple[LegalDomain, float]:
         Tuple of (domain, confidence_score)
     """
     # Check cache first
+    qhash = None
     try:
-        from app.core.cache import get_cached_classification, cache_classification
+        from app.core.cache import get_cached_classification, question_hash
 
-        cached = get_cached_classification(question)
+        qhash = question_hash(question)
+        cached = get_cached_classification(question, qhash=qhash)
         if cached:
             domain = LegalDomain(cached["domain"])
             return domain, cached["confidence"]
@@ -115,31 +131,24 @@ def classify_question(question: str) -> tuple[LegalDomain, float]:
         pass  # Fall through to normal classification
 
     question_lower = question.lower()
-    scores: dict[LegalDomain, float] = {}
-
-    for domain_key, domain_info in LEGAL_DOMAINS.items():
-        domain = LegalDomain(domain_key)
-        score = 0.0
-        keywords = domain_info["keywords"]
-
-        for keyword in keywords:
-            if keyword in question_lower:
-                score += 1.0
-
-        if score > 0:
-            scores[domain] = score / len(keywords)
+    hits = np.fromiter(
+        (keyword in question_lower for keyword in _KWS), dtype=bool, count=len(_KWS)
+    )
+    scores = (_KW_MATRIX @ hits) / _DOMAIN_SIZES
+    best = int(np.argmax(scores))
 
-    if not scores:
+    if scores[best] == 0:
         result = (LegalDomain.UNKNOWN, 0.0)
     else:
-        best_domain = max(scores.items(), key=lambda x: x[1])
-        result = (best_domain[0], best_domain[1])
+        result = (LegalDomain(_DOMAIN_KEYS[best]), float(scores[best]))
 
     # Cache the result
     try:
         from app.core.cache import cache_classification
 
-        cache_classification(question, result[0].value, result[1], ttl=3600)
+        cache_classification(
+            question, result[0].value, result[1], ttl=3600, qhash=qhash
+        )
     except Exception:
         pass  # Cache failure shouldn't break classification
 
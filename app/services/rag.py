@@ -1,26 +1,34 @@
+import logging
+import re
 import time
-from functools import partial
+from functools import lru_cache, partial
 from typing import Dict, Any, Optional
 
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_community.chat_models import ChatOpenAI
 from langchain_community.llms import Ollama
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnableLambda
 from langchain.memory import ConversationBufferMemory
 
 from app.services.vectorstore import get_vectorstore
 from app.services.enhanced_retrieval import EnhancedRetriever
 from app.services.question_classifier import classify_question, get_domain_label
 from app.services.reranker import rerank_documents
-from app.core.config import DEFAULT_TOP_K, OPENAI_API_KEY, OLLAMA_MODEL
+from app.core.config import (
+    DEFAULT_TOP_K,
+    MAX_CONTEXT_CHARS,
+    OPENAI_API_KEY,
+    OLLAMA_MODEL,
+)
 from app.core.cache import (
     cache_rag_result,
     get_cached_rag_result,
     cache_classification,
     get_cached_classification,
+    question_hash,
 )
 
+logger = logging.getLogger(__name__)
 
 PERSIAN_LEGAL_SYSTEM_PROMPT = """
 شما یک دستیار حقوقی متخصص و باتجربه در قوانین و مقررات جمهوری اسلامی ایران هستید.
@@ -47,6 +55,9 @@ PERSIAN_LEGAL_SYSTEM_PROMPT = """
   * منبع: [نام فایل/سند]
 """.strip()
 
+# Keywords that indicate the answer cites legal sources (one regex pass)
+_CITATION_RE = re.compile("ماده|اصل|قانون|منبع|منابع")
+
 
 def _get_llm():
     if OPENAI_API_KEY:
@@ -58,16 +69,53 @@ def _get_llm():
 
 def _extract_citations(answer: str, docs: list) -> list[str]:
     """Extract citation sources from answer and documents."""
-    sources = []
-    seen = set()
+    # dict.fromkeys dedupes while preserving retrieval order
+    return list(
+        dict.fromkeys(
+            doc.metadata.get("source", "")
+            for doc in docs
+            if doc.metadata.get("source")
+        )
+    )
 
-    for doc in docs:
-        source = doc.metadata.get("source", "")
-        if source and source not in seen:
-            seen.add(source)
-            sources.append(source)
 
-    return sources
+@lru_cache(maxsize=2)
+def _build_prompt(with_history: bool) -> ChatPromptTemplate:
+    """Build (and cache) the answer prompt, with or without chat history."""
+    messages = [("system", PERSIAN_LEGAL_SYSTEM_PROMPT)]
+    if with_history:
+        # اگر history داریم، از MessagesPlaceholder استفاده می‌کنیم
+        messages.append(MessagesPlaceholder(variable_name="chat_history"))
+    messages.append(
+        (
+            "human",
+            "سوال: {question}\n\nمتون بازیابی‌شده:\n{context}\n\nپاسخ دقیق و مستند:",
+        )
+    )
+    return ChatPromptTemplate.from_messages(messages)
+
+
+def _build_context(docs: list) -> tuple[str, list]:
+    """Join document contents, truncated to the context character budget.
+
+    Returns:
+        Tuple of (context, docs actually included in the context)
+    """
+    parts = []
+    used_docs = []
+    total = 0
+    for doc in docs:
+        text = doc.page_content
+        if total + len(text) > MAX_CONTEXT_CHARS:
+            remaining = MAX_CONTEXT_CHARS - total
+            if remaining > 0:
+                parts.append(text[:remaining])
+                used_docs.append(doc)
+            break
+        parts.append(text)
+        used_docs.append(doc)
+        total += len(text) + 2  # account for the "\n\n" separator
+    return "\n\n".join(parts), used_docs
 
 
 def build_rag_chain(
@@ -88,35 +136,10 @@ def build_rag_chain(
         retriever = vs.as_retriever(search_kwargs={"k": k})
         enhanced_retriever = None
 
-    # ساخت prompt با پشتیبانی از memory
-    if memory:
-        # اگر memory داریم، از MessagesPlaceholder استفاده می‌کنیم
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", PERSIAN_LEGAL_SYSTEM_PROMPT),
-                MessagesPlaceholder(variable_name="chat_history"),
-                (
-                    "human",
-                    "سوال: {question}\n\nمتون بازیابی‌شده:\n{context}\n\nپاسخ دقیق و مستند:",
-                ),
-            ]
-        )
-    else:
-        # بدون memory، prompt ساده
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", PERSIAN_LEGAL_SYSTEM_PROMPT),
-                (
-                    "human",
-                    "سوال: {question}\n\nمتون بازیابی‌شده:\n{context}\n\nپاسخ دقیق و مستند:",
-                ),
-            ]
-        )
-
     if llm is None:
 
         def run_fallback(question: str):
-            start_time = time.time()
+            start_ns = time.perf_counter_ns()
 
             if use_enhanced_retrieval and enhanced_retriever:
                 docs, domain, confidence = (
@@ -132,14 +155,15 @@ def build_rag_chain(
                 docs = basic_retriever.invoke("query: " + question)
                 domain, confidence = None, 0.0
 
-            context = "\n\n".join(d.page_content for d in docs)
+            context, docs = _build_context(docs)
             sources = _extract_citations(context, docs)
             answer = (
                 "بر اساس متون یافت‌شده، موارد مرتبط در زیر آمده است. لطفاً با دقت مطالعه کنید و در صورت نیاز سوال را دقیق‌تر مطرح نمایید.\n\n"
                 + context
             )
 
-            elapsed = time.time() - start_time
+            # Monotonic clock; integer ns truncated to whole milliseconds
+            elapsed = (time.perf_counter_ns() - start_ns) // 1_000_000 / 1000
             return {
                 "answer": answer,
                 "sources": sources,
@@ -201,7 +225,8 @@ def build_rag_chain(
             x["detected_domain"] = domain
             x["domain_confidence"] = confidence
 
-        context = "\n\n".join(d.page_content for d in docs)
+        # Only documents that made it into the context are cited as sources
+        context, docs = _build_context(docs)
         x["context"] = context
         x["retrieved_docs"] = docs
         # توجه: history از memory مستقیماً در run function خوانده می‌شود
@@ -218,19 +243,24 @@ def build_rag_chain(
         use_rerank=use_reranking,
     )
 
-    chain = RunnableLambda(_prepare_inputs_bound) | prompt | llm | StrOutputParser()
+    # run() prepares inputs (retrieval + rerank) itself, so the chain only
+    # formats the prompt and calls the LLM once per request.
+    # Empty history skips the MessagesPlaceholder branch entirely
+    chains = {
+        with_history: _build_prompt(with_history) | llm | StrOutputParser()
+        for with_history in ((False, True) if memory else (False,))
+    }
 
     def run(question: str) -> Dict[str, Any]:
-        start_time = time.time()
+        start_ns = time.perf_counter_ns()
 
-        # Check cache first
-        cache_key_params = (question, k, use_enhanced_retrieval)
-        cached_result = get_cached_rag_result(question, k, use_enhanced_retrieval)
+        # Check cache first (keyed on a compact hash of the question)
+        qhash = question_hash(question)
+        cached_result = get_cached_rag_result(
+            question, k, use_enhanced_retrieval, qhash=qhash
+        )
         if cached_result:
-            import logging
-
-            logger = logging.getLogger(__name__)
-            logger.info(f"Cache hit for question: {question[:50]}...")
+            logger.info("Cache hit for question: %s...", question[:50])
             return cached_result
 
         # Prepare inputs (includes retrieval and memory)
@@ -243,19 +273,14 @@ def build_rag_chain(
             "question": question,
             "context": prepared.get("context", ""),
         }
-        # اضافه کردن history اگر memory وجود داشته باشد (مستقیماً از memory بخوانیم)
-        if memory:
-            # باید history را مستقیماً از memory بخوانیم (نه از prepared)
-            # چون memory ممکن است بعد از prepared به‌روز شده باشد
-            history_messages = memory.chat_memory.messages
-            chain_inputs["chat_history"] = history_messages
-            # لاگ برای دیباگ (می‌توانید بعداً حذف کنید)
-            import logging
-
-            logger = logging.getLogger(__name__)
-            logger.info(f"Memory history contains {len(history_messages)} messages")
+        # history را یک بار مستقیماً از memory بخوانیم (نه از prepared)
+        # چون memory ممکن است بعد از prepared به‌روز شده باشد
+        messages = memory.chat_memory.messages if memory else ()
+        if messages:
+            chain_inputs["chat_history"] = messages
+            logger.info("Memory history contains %d messages", len(messages))
 
-        result_text = chain.invoke(chain_inputs)
+        result_text = chains[bool(messages)].invoke(chain_inputs)
 
         # توجه: سوال و پاسخ در دیتابیس ذخیره می‌شوند
         # memory فقط برای این درخواست استفاده می‌شود و بعد از آن از بین می‌رود
@@ -265,21 +290,18 @@ def build_rag_chain(
         sources = _extract_citations(result_text, docs)
 
         # Calculate metrics
-        elapsed = time.time() - start_time
+        elapsed = (time.perf_counter_ns() - start_ns) // 1_000_000 / 1000
         citation_count = len(sources)
         has_citations = citation_count > 0
 
         # Check if answer contains citations (simple heuristic)
-        answer_has_citations = any(
-            keyword in result_text
-            for keyword in ["ماده", "اصل", "قانون", "منبع", "منابع"]
-        )
+        answer_has_citations = bool(_CITATION_RE.search(result_text))
         citation_accuracy = 1.0 if (has_citations and answer_has_citations) else 0.5
 
         response = {
             "answer": result_text,
             "sources": sources,
-            "response_time_seconds": round(elapsed, 3),
+            "response_time_seconds": elapsed,
             "citation_count": citation_count,
             "citation_accuracy": citation_accuracy,
         }
@@ -292,7 +314,9 @@ def build_rag_chain(
             response["domain_confidence"] = round(confidence, 2)
 
         # Cache the result
-        cache_rag_result(question, k, use_enhanced_retrieval, response, ttl=3600)
+        cache_rag_result(
+            question, k, use_enhanced_retrieval, response, ttl=3600, qhash=qhash
+        )
 
         return response
 
@@ -3,47 +3,140 @@
 from typing import List, Optional
 from langchain_core.documents import Document
 import logging
-from app.core.config import RERANKER_ENABLED, RERANKER_MODEL
+import threading
+import time
+from app.core.config import (
+    RERANKER_DEVICE,
+    RERANKER_ENABLED,
+    RERANKER_MODEL,
+    RERANKER_RETRY_INTERVAL,
+)
 
 logger = logging.getLogger(__name__)
 
 _reranker_model = None
+_reranker_tokenizer = None
 _reranker_loading_attempted = False
+_reranker_last_failure: Optional[float] = None
+_reranker_lock = threading.Lock()
+
+
+def _should_load() -> bool:
+    """Whether a load should be attempted now (not loaded, not in backoff)."""
+    if _reranker_model is not None or _reranker_loading_attempted:
+        return False
+    if _reranker_last_failure is None:
+        return True
+    return time.monotonic() - _reranker_last_failure >= RERANKER_RETRY_INTERVAL
 
 
 def get_reranker_model():
-    """Get or load reranker model."""
-    global _reranker_model, _reranker_loading_attempted
+    """Get or load reranker model.
 
+    Returns:
+        Tuple of (tokenizer, model), or None if reranking is unavailable
+    """
     # Check if reranking is disabled via configuration
     if not RERANKER_ENABLED:
         return None
 
-    if _reranker_model is None and not _reranker_loading_attempted:
+    if _should_load():
+        with _reranker_lock:
+            # Re-check under the lock: another thread may have loaded it, or
+            # just failed (in which case we wait for the backoff window)
+            if _should_load():
+                _load_reranker_model()
+
+    if _reranker_model is None:
+        return None
+    return _reranker_tokenizer, _reranker_model
+
+
+def _load_reranker_model() -> None:
+    """Load tokenizer and model into module globals (caller holds the lock)."""
+    global _reranker_model, _reranker_tokenizer, _reranker_loading_attempted
+    global _reranker_last_failure
+
+    import os
+
+    try:
+        import torch
+        from transformers import (
+            AutoModelForSequenceClassification,
+            AutoTokenizer,
+        )
+    except ImportError as e:
+        # Missing dependencies won't fix themselves; don't retry
         _reranker_loading_attempted = True
-        try:
-            import os
-            from sentence_transformers import CrossEncoder
+        logger.warning(
+            f"Reranker dependencies not installed: {e}. Re-ranking will be disabled."
+        )
+        return
 
-            # تنظیم timeout برای Hugging Face
-            hf_timeout = int(os.getenv("HF_TIMEOUT", "300"))
-            os.environ.setdefault("HF_HUB_DOWNLOAD_TIMEOUT", str(hf_timeout))
+    try:
+        # تنظیم timeout برای Hugging Face
+        hf_timeout = int(os.getenv("HF_TIMEOUT", "300"))
+        os.environ.setdefault("HF_HUB_DOWNLOAD_TIMEOUT", str(hf_timeout))
 
-            logger.info(
-                f"Loading reranker model: {RERANKER_MODEL} (timeout: {hf_timeout}s)"
+        logger.info(
+            f"Loading reranker model: {RERANKER_MODEL} (timeout: {hf_timeout}s)"
+        )
+        # Load tokenizer and model directly (instead of CrossEncoder) so all
+        # query/document pairs can be tokenized once and scored in one pass
+        tokenizer = AutoTokenizer.from_pretrained(RERANKER_MODEL)
+        model = AutoModelForSequenceClassification.from_pretrained(RERANKER_MODEL)
+        model.eval()
+
+        num_labels = model.config.num_labels
+        if num_labels not in (1, 2):
+            # Not a relevance cross-encoder; retrying won't help
+            _reranker_loading_attempted = True
+            logger.warning(
+                f"Reranker model '{RERANKER_MODEL}' has {num_labels} labels; "
+                "expected 1 (relevance score) or 2 (irrelevant/relevant). "
+                "Re-ranking will be disabled."
             )
-            _reranker_model = CrossEncoder(RERANKER_MODEL)
-            logger.info(f"Reranker model '{RERANKER_MODEL}' loaded successfully")
+            return
 
-        except Exception as e:
+        cuda_available = torch.cuda.is_available()
+        if RERANKER_DEVICE == "cuda" and not cuda_available:
             logger.warning(
-                f"Could not load reranker model '{RERANKER_MODEL}': {e}. "
-                "Re-ranking will be disabled. To disable reranking entirely, set RERANKER_ENABLED=false in environment variables. "
-                f"If timeout issues persist, try increasing HF_TIMEOUT (current: {os.getenv('HF_TIMEOUT', '300')}s)"
+                "RERANKER_DEVICE=cuda but CUDA is not available; "
+                "falling back to CPU for the reranker"
             )
-            return None
+        if RERANKER_DEVICE != "cpu" and cuda_available:
+            # fp16 halves memory traffic and runs the GEMMs on tensor cores
+            model = model.half().to("cuda")
+
+        # Publish only fully initialized objects; readers check without the lock
+        _reranker_tokenizer = tokenizer
+        _reranker_model = model
+        _reranker_loading_attempted = True
+        logger.info(
+            f"Reranker model '{RERANKER_MODEL}' loaded successfully on {model.device}"
+        )
+
+    except Exception as e:
+        # Transient errors (e.g. network timeouts during download) are retried,
+        # but only after RERANKER_RETRY_INTERVAL so requests don't queue up
+        # behind repeated slow downloads
+        _reranker_last_failure = time.monotonic()
+        logger.warning(
+            f"Could not load reranker model '{RERANKER_MODEL}': {e}. "
+            f"Re-ranking is disabled for the next {RERANKER_RETRY_INTERVAL}s, then the load will be retried. To disable reranking entirely, set RERANKER_ENABLED=false in environment variables. "
+            f"If timeout issues persist, try increasing HF_TIMEOUT (current: {os.getenv('HF_TIMEOUT', '300')}s)"
+        )
+
+
+def _topk_indices(scores, top_k: Optional[int] = None):
+    """Indices of the top_k scores in descending order (all if top_k is None)."""
+    import numpy as np
 
-    return _reranker_model
+    # argpartition is O(n) when only a prefix of the ranking is needed
+    if top_k and top_k < len(scores):
+        order = np.argpartition(-scores, top_k)[:top_k]
+        return order[np.argsort(-scores[order])]
+    return np.argsort(-scores)
 
 
 def rerank_documents(
@@ -65,26 +158,37 @@ def rerank_documents(
     if not documents:
         return documents
 
-    model = get_reranker_model()
-    if not model:
+    reranker = get_reranker_model()
+    if not reranker:
         # If reranker not available, return original order
         return documents[:top_k] if top_k else documents
 
     try:
-        # Prepare pairs for scoring
-        pairs = [[query, doc.page_content] for doc in documents]
-
-        # Get scores
-        scores = model.predict(pairs)
-
-        # Sort by score (descending)
-        scored_docs = list(zip(documents, scores))
-        scored_docs.sort(key=lambda x: x[1], reverse=True)
-
-        # Return top_k documents
-        reranked = [doc for doc, score in scored_docs]
-        if top_k:
-            reranked = reranked[:top_k]
+        import numpy as np
+        import torch
+
+        tokenizer, model = reranker
+
+        # Tokenize all (query, document) pairs at once and score them in a
+        # single padded forward pass
+        encoded = tokenizer(
+            [query] * len(documents),
+            [doc.page_content for doc in documents],
+            padding=True,
+            truncation=True,
+            max_length=512,
+            return_tensors="pt",
+        ).to(model.device)
+        with torch.inference_mode():
+            logits = model(**encoded).logits.float()
+        if logits.shape[-1] == 1:
+            scores = logits[:, 0]
+        else:
+            # Two-label models: rank by the positive-class margin
+            scores = logits[:, 1] - logits[:, 0]
+        scores = np.atleast_1d(scores.cpu().numpy())
+
+        reranked = [documents[i] for i in _topk_indices(scores, top_k)]
 
         logger.info(
             f"Re-ranked {len(documents)} documents, returning top {len(reranked)}"
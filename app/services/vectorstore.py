@@ -1,12 +1,38 @@
-from typing import List
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional
+import hashlib
+import importlib.util
+import json
 import os
 import logging
+import queue
+import sqlite3
+import threading
+import time
+
+# دانلود موازی فایل‌های مدل با hf_transfer (باید قبل از import شدن huggingface_hub باشد)
+if importlib.util.find_spec("hf_transfer") is not None:
+    os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1")
 
 from langchain_community.vectorstores import Chroma
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.documents import Document
 
-from app.core.config import PERSIST_DIRECTORY, EMBEDDING_MODEL
+from app.core.config import (
+    PERSIST_DIRECTORY,
+    CHROMA_HOST,
+    CHROMA_PORT,
+    EMBEDDING_MODEL,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_INT8_ONNX,
+    CHROMA_PERSIST_EVERY,
+    CHROMA_BATCH_SIZE,
+    CHROMA_AUTOTUNE_BATCH,
+    CHROMA_SEARCH_EF,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -18,42 +44,451 @@ os.environ["HF_HUB_DOWNLOAD_TIMEOUT"] = str(HF_TIMEOUT)
 os.environ["HF_HUB_DOWNLOAD_TIMEOUT_S"] = str(HF_TIMEOUT)
 
 
+# Process-wide caches: the embedding model is loaded once, and one Chroma
+# handle is kept per collection
+_VS_CACHE: dict[str, Chroma] = {}
+_VS_LOCK = threading.Lock()
+# A single PersistentClient shared by every handle (opening one walks the
+# on-disk segments, so it is not recreated per call)
+_CHROMA_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+_EMBEDDINGS_LOCK = threading.Lock()
+
+
 def get_embeddings() -> HuggingFaceEmbeddings:
-    """Get embeddings model with increased timeout for slow connections."""
+    """Get the (cached) embeddings model."""
+    with _EMBEDDINGS_LOCK:
+        return _load_embeddings(EMBEDDING_MODEL)
+
+
+# int8 ONNX weights tuned for VNNI dot-product instructions
+_ONNX_QUANT_CONFIG = "avx512_vnni"
+_ONNX_INT8_FILE = f"onnx/model_qint8_{_ONNX_QUANT_CONFIG}.onnx"
+
+
+def _int8_onnx_embeddings(model_name: str) -> Optional[HuggingFaceEmbeddings]:
+    """Embeddings backed by an int8-quantized ONNX export of model_name.
+
+    The export runs once and is cached under PERSIST_DIRECTORY/onnx-<model>/.
+    Returns None (caller falls back to PyTorch) when a GPU is available or
+    the ONNX dependencies are missing.
+    """
     try:
-        # تنظیم timeout برای Hugging Face Hub (اگر قبلاً تنظیم نشده)
-        os.environ.setdefault("HF_HUB_DOWNLOAD_TIMEOUT", str(HF_TIMEOUT))
+        import torch
+
+        if torch.cuda.is_available():
+            logger.info("CUDA is available; skipping int8 ONNX embeddings")
+            return None
+    except ImportError:
+        pass
+
+    model_dir = Path(PERSIST_DIRECTORY) / f"onnx-{model_name.replace('/', '--')}"
+    try:
+        if not (model_dir / _ONNX_INT8_FILE).exists():
+            from sentence_transformers import (
+                SentenceTransformer,
+                export_dynamic_quantized_onnx_model,
+            )
+
+            logger.info(f"Exporting '{model_name}' to int8 ONNX in {model_dir}")
+            model = SentenceTransformer(model_name, backend="onnx")
+            model.save_pretrained(str(model_dir))
+            export_dynamic_quantized_onnx_model(
+                model, _ONNX_QUANT_CONFIG, str(model_dir)
+            )
 
-        embeddings = HuggingFaceEmbeddings(
-            model_name=EMBEDDING_MODEL,
+        return HuggingFaceEmbeddings(
+            model_name=str(model_dir),
+            model_kwargs={
+                "backend": "onnx",
+                "model_kwargs": {
+                    "file_name": _ONNX_INT8_FILE,
+                    "provider": "CPUExecutionProvider",
+                },
+            },
             encode_kwargs={"normalize_embeddings": True},
         )
-        logger.info(f"Embeddings model '{EMBEDDING_MODEL}' initialized successfully")
+    except Exception as e:
+        logger.warning(
+            f"int8 ONNX embeddings unavailable ({e}); falling back to PyTorch. "
+            "Install optimum[onnxruntime] to enable them."
+        )
+        return None
+
+
+@lru_cache(maxsize=1)
+def _load_embeddings(model_name: str) -> HuggingFaceEmbeddings:
+    """Load embeddings model with increased timeout for slow connections."""
+    try:
+        # تنظیم timeout برای Hugging Face Hub (اگر قبلاً تنظیم نشده)
+        os.environ.setdefault("HF_HUB_DOWNLOAD_TIMEOUT", str(HF_TIMEOUT))
+
+        embeddings = None
+        if EMBEDDING_INT8_ONNX:
+            embeddings = _int8_onnx_embeddings(model_name)
+        if embeddings is None:
+            embeddings = HuggingFaceEmbeddings(
+                model_name=model_name,
+                encode_kwargs={"normalize_embeddings": True},
+            )
+        logger.info(f"Embeddings model '{model_name}' initialized successfully")
         return embeddings
     except Exception as e:
-        logger.error(f"Failed to initialize embeddings model '{EMBEDDING_MODEL}': {e}")
+        logger.error(f"Failed to initialize embeddings model '{model_name}': {e}")
         logger.error(
             "If you're experiencing timeout issues, try:\n"
             "1. Set HF_TIMEOUT environment variable to a higher value (e.g., 600 for 10 minutes)\n"
             "2. Check your internet connection\n"
             "3. Use a VPN if Hugging Face is blocked in your region\n"
-            "4. Pre-download the model manually using: huggingface-cli download intfloat/multilingual-e5-base"
+            "4. Pre-download the model using: python scripts/prefetch_model.py"
         )
         raise
 
 
+def get_chroma_client():
+    """Get the process-wide ChromaDB client.
+
+    Connects to a Chroma server when CHROMA_HOST is set, so index writes run
+    in that process instead of competing with embedding for this one;
+    otherwise opens an embedded PersistentClient on PERSIST_DIRECTORY.
+    """
+    global _CHROMA_CLIENT
+    if _CHROMA_CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CHROMA_CLIENT is None:
+                import chromadb
+
+                if CHROMA_HOST:
+                    logger.info(f"Using Chroma server at {CHROMA_HOST}:{CHROMA_PORT}")
+                    _CHROMA_CLIENT = chromadb.HttpClient(
+                        host=CHROMA_HOST, port=CHROMA_PORT
+                    )
+                else:
+                    _CHROMA_CLIENT = chromadb.PersistentClient(path=PERSIST_DIRECTORY)
+    return _CHROMA_CLIENT
+
+
 def get_vectorstore(collection_name: str = "legal-texts") -> Chroma:
-    embeddings = get_embeddings()
-    return Chroma(
-        collection_name=collection_name,
-        embedding_function=embeddings,
-        persist_directory=PERSIST_DIRECTORY,
+    vs = _VS_CACHE.get(collection_name)
+    if vs is None:
+        with _VS_LOCK:
+            vs = _VS_CACHE.get(collection_name)
+            if vs is None:
+                # Embeddings first: a failed model load must not create the DB dir
+                embeddings = get_embeddings()
+                vs = Chroma(
+                    client=get_chroma_client(),
+                    collection_name=collection_name,
+                    embedding_function=embeddings,
+                    # Kept so vs.persist() stays valid with an injected client
+                    persist_directory=PERSIST_DIRECTORY,
+                )
+                _VS_CACHE[collection_name] = vs
+    return vs
+
+
+def reset_cache(collection_name: Optional[str] = None) -> None:
+    """Drop cached Chroma handles (all, or one collection) after it is deleted."""
+    with _VS_LOCK:
+        if collection_name is None:
+            _VS_CACHE.clear()
+        else:
+            _VS_CACHE.pop(collection_name, None)
+
+
+def _document_id(doc: Document) -> str:
+    """Stable id derived from source and content.
+
+    Re-ingesting the same file is idempotent, while boilerplate text shared
+    by different laws is still stored once per source (so its citation and
+    the per-source chunk counts stay correct).
+    """
+    source = str((doc.metadata or {}).get("source", ""))
+    key = f"{source}\0{doc.page_content}"
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _l2_normalize(embeddings):
+    """L2-normalize the rows of an (N, D) array in place; zero rows stay zero."""
+    import numpy as np
+
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    np.divide(embeddings, norms, out=embeddings, where=norms > 0)
+    return embeddings
+
+
+def _embed_texts(texts: List[str]):
+    """Encode texts in large batches with the cached SentenceTransformer."""
+    # Reuse the model behind the cached HuggingFaceEmbeddings instead of
+    # loading a second copy (it picks CUDA automatically when available)
+    model = get_embeddings()._client
+    embeddings = model.encode(
+        # Same preprocessing as HuggingFaceEmbeddings.embed_documents /
+        # embed_query, so stored vectors match query-time ones
+        [text.replace("\n", " ") for text in texts],
+        batch_size=EMBEDDING_BATCH_SIZE,
+        show_progress_bar=False,
+        convert_to_numpy=True,
     )
+    # Normalize the whole (N, D) float32 matrix in one vectorized pass,
+    # independent of which backend (PyTorch / ONNX) produced it
+    return _l2_normalize(embeddings)
+
+
+# Max embedded batches waiting for the Chroma writer
+_PIPELINE_DEPTH = 4
+_PIPELINE_DONE = object()
+
+
+_METADATA_SCALARS = (str, int, float, bool)
+
+
+def _clean_metadata(metadata: dict) -> Optional[dict]:
+    """Make metadata storable by Chroma without LangChain's per-doc filtering.
+
+    Scalar values pass through, None values are dropped and anything else
+    (lists, dicts, dates) is JSON-encoded. Returns None for empty metadata.
+    """
+    if not metadata:
+        return None
+    if all(isinstance(v, _METADATA_SCALARS) for v in metadata.values()):
+        return metadata
+    return {
+        k: v
+        if isinstance(v, _METADATA_SCALARS)
+        else json.dumps(v, ensure_ascii=False, default=str)
+        for k, v in metadata.items()
+        if v is not None
+    } or None
+
+
+def _prepare_batch(batch: List[Document]) -> dict:
+    """Dedupe and embed a batch into keyword arguments for collection.add."""
+    # Repeated (source, text) pairs share an id; Chroma rejects duplicate ids
+    # within one add
+    unique: dict[str, Document] = {}
+    for doc in batch:
+        unique.setdefault(_document_id(doc), doc)
+
+    texts = [doc.page_content for doc in unique.values()]
+    return {
+        "ids": list(unique),
+        "documents": texts,
+        "metadatas": [_clean_metadata(doc.metadata) for doc in unique.values()],
+        "embeddings": _embed_texts(texts),
+    }
+
+
+# Ids per existence lookup (well under SQLite's bound-parameter limit)
+_DEDUP_LOOKUP_SIZE = 5000
+
+
+def _new_documents(collection, documents: List[Document]) -> List[Document]:
+    """Drop documents that are repeated or already stored in collection.
+
+    Ids hash (source, text), so a stored id means the same chunk of the same
+    file was ingested before; skipping it saves its forward pass and HNSW
+    insert.
+    """
+    unique: dict[str, Document] = {}
+    for doc in documents:
+        unique.setdefault(_document_id(doc), doc)
+
+    ids = list(unique)
+    for i in range(0, len(ids), _DEDUP_LOOKUP_SIZE):
+        known = collection.get(ids=ids[i : i + _DEDUP_LOOKUP_SIZE], include=[])
+        for doc_id in known["ids"]:
+            del unique[doc_id]
+
+    skipped = len(documents) - len(unique)
+    if skipped:
+        logger.info(f"Skipping {skipped} duplicate or already stored documents")
+    return list(unique.values())
+
+
+def _ingest_batches(
+    vs: Chroma, documents: List[Document], batch_size: int, label: str = ""
+) -> tuple[int, int]:
+    """Embed and write documents in batches, overlapping the two stages.
+
+    An encoder thread embeds batches into a bounded queue while the calling
+    thread writes them to Chroma, so model compute and SQLite/HNSW writes run
+    concurrently.
+
+    The store is persisted every CHROMA_PERSIST_EVERY batches and once at the
+    end rather than after every batch. Durability trade-off: if the process
+    crashes mid-ingest, batches since the last checkpoint may need to be
+    re-ingested (content-hash ids make that idempotent).
+
+    Documents are sorted by length first ("smart batching"): each batch then
+    holds texts of similar length, so little compute is spent on padding.
+    Ids are content hashes, so the order does not affect what is stored.
+
+    Documents that are already stored (same source and text) are skipped before
+    embedding.
+
+    Returns:
+        Tuple of (documents added, number of batches)
+    """
+    documents = _new_documents(vs._collection, documents)
+    documents = sorted(documents, key=lambda doc: len(doc.page_content))
+    total_batches = (len(documents) + batch_size - 1) // batch_size
+    pending: queue.Queue = queue.Queue(maxsize=_PIPELINE_DEPTH)
+    stop = threading.Event()
+
+    def put(item) -> None:
+        # Give up if the writer has failed, instead of blocking on a full queue
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def produce() -> None:
+        try:
+            for i in range(0, len(documents), batch_size):
+                if stop.is_set():
+                    return
+                put(_prepare_batch(documents[i : i + batch_size]))
+        finally:
+            put(_PIPELINE_DONE)
+
+    total_added = 0
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        producer = executor.submit(produce)
+        try:
+            batch_num = 0
+            while True:
+                prepared = pending.get()
+                if prepared is _PIPELINE_DONE:
+                    break
+                batch_num += 1
+                logger.info(
+                    f"Adding batch {batch_num}/{total_batches} "
+                    f"({len(prepared['ids'])} documents){label}"
+                )
+                vs._collection.add(**prepared)
+                total_added += len(prepared["ids"])
+                # Persist هر چند batch یک بار (checkpoint)، نه بعد از هر batch
+                if batch_num % CHROMA_PERSIST_EVERY == 0:
+                    vs.persist()
+        finally:
+            stop.set()
+            # Final flush for whatever was written since the last checkpoint
+            vs.persist()
+        # Re-raise any error from the encoder thread
+        producer.result()
+
+    return total_added, total_batches
+
+
+# Candidate insert batch sizes measured by _autotune_batch_size
+_AUTOTUNE_SIZES = (64, 128, 256, 512, 1024, 2048)
+# Timed runs per size (after one warmup run); the fastest run is kept
+_AUTOTUNE_REPEATS = 3
+_AUTOTUNE_FILE = Path(PERSIST_DIRECTORY) / "batch_size_tuning.json"
+
+
+def _read_tuning_cache() -> dict:
+    """Tuned batch sizes per collection, as cached in _AUTOTUNE_FILE."""
+    if not _AUTOTUNE_FILE.exists():
+        return {}
+    try:
+        cached = json.loads(_AUTOTUNE_FILE.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable batch size tuning file: {e}")
+        return {}
+    return cached if isinstance(cached, dict) else {}
+
+
+def _time_inserts(prepared: dict, size: int) -> float:
+    """Seconds to insert a prepared sample in batches of size into a scratch
+    collection (created and dropped outside the timed region)."""
+    client = get_chroma_client()
+    name = "autotune-scratch"
+    try:
+        client.delete_collection(name)
+    except Exception:
+        pass
+    scratch = client.create_collection(name)
+    try:
+        start = time.perf_counter()
+        for i in range(0, len(prepared["ids"]), size):
+            scratch.add(**{k: v[i : i + size] for k, v in prepared.items()})
+        return time.perf_counter() - start
+    finally:
+        client.delete_collection(name)
+
+
+def _autotune_batch_size(
+    vs: Chroma, documents: List[Document]
+) -> tuple[int, int, int]:
+    """Pick the insert batch size with the lowest collection.add time.
+
+    The first max(_AUTOTUNE_SIZES) new documents are embedded once; that
+    sample is then inserted into a scratch collection at every candidate
+    size (one warmup run, then _AUTOTUNE_REPEATS timed runs each), so only
+    insert cost is measured, on the same data for every size. The sample is
+    finally written to the real collection with the winning size. The winner
+    is cached per collection so later ingests skip the measurement.
+
+    Args:
+        documents: Documents not yet stored (already passed through
+            _new_documents)
+
+    Returns:
+        Tuple of (batch size, documents consumed, documents added)
+    """
+    collection = vs._collection
+    cached = _read_tuning_cache()
+    entry = cached.get(collection.name)
+    if isinstance(entry, dict) and "batch_size" in entry:
+        return int(entry["batch_size"]), 0, 0
+
+    sample_size = max(_AUTOTUNE_SIZES)
+    if len(documents) < sample_size:
+        # Not enough documents to measure every size; use the configured one
+        return CHROMA_BATCH_SIZE, 0, 0
+
+    sample = documents[:sample_size]
+    prepared = _prepare_batch(sample)
+
+    _time_inserts(prepared, _AUTOTUNE_SIZES[0])  # warmup
+    timings = {
+        size: min(_time_inserts(prepared, size) for _ in range(_AUTOTUNE_REPEATS))
+        / len(prepared["ids"])
+        for size in _AUTOTUNE_SIZES
+    }
+    best = min(timings, key=timings.get)
+    logger.info(
+        f"Batch size autotune for '{collection.name}': picked {best} "
+        f"({', '.join(f'{k}: {v * 1000:.3f}ms/doc' for k, v in timings.items())})"
+    )
+
+    for i in range(0, len(prepared["ids"]), best):
+        collection.add(**{k: v[i : i + best] for k, v in prepared.items()})
+
+    cached[collection.name] = {"batch_size": best, "timings": timings}
+    try:
+        _AUTOTUNE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        _AUTOTUNE_FILE.write_text(json.dumps(cached), encoding="utf-8")
+    except OSError as e:
+        logger.warning(f"Could not cache tuned batch size: {e}")
+    return best, len(sample), len(prepared["ids"])
 
 
 def add_documents(
     documents: List[Document], collection_name: str = "legal-texts"
 ) -> int:
+    """Embed and store documents, returning the number of new chunks.
+
+    Chroma has no switch to defer HNSW construction, so every batch is
+    inserted into the index incrementally. The collection keeps Chroma's
+    build parameters (ef_construction=100, max_neighbors=16), which are
+    already the cheap bulk-load settings; after a large ingest, call
+    set_search_ef() once to switch to query-oriented parameters.
+    """
     if not documents:
         return 0
 
@@ -62,24 +497,22 @@ def add_documents(
     logger = logging.getLogger(__name__)
 
     # ChromaDB حداکثر batch size حدود 5461 است، پس به batch های کوچکتر تقسیم می‌کنیم
-    BATCH_SIZE = 5000  # کمی کمتر از حد مجاز برای اطمینان
+    # (CHROMA_BATCH_SIZE، یا مقدار بهینه‌شده با CHROMA_AUTOTUNE_BATCH)
+    batch_size = CHROMA_BATCH_SIZE
 
-    total_added = 0
     vs = get_vectorstore(collection_name)
 
     try:
         # تقسیم documents به batch های کوچکتر
-        total_batches = (len(documents) + BATCH_SIZE - 1) // BATCH_SIZE
-        for i in range(0, len(documents), BATCH_SIZE):
-            batch = documents[i : i + BATCH_SIZE]
-            batch_num = i // BATCH_SIZE + 1
-            logger.info(
-                f"Adding batch {batch_num}/{total_batches} ({len(batch)} documents)"
-            )
-            vs.add_documents(batch)
-            total_added += len(batch)
-            # Persist بعد از هر batch برای اطمینان از ذخیره داده‌ها
-            vs.persist()
+        tuned_added = 0
+        remaining = documents
+        if CHROMA_AUTOTUNE_BATCH:
+            # Dedup first so the probe neither re-adds nor counts stored ids
+            remaining = _new_documents(vs._collection, documents)
+            batch_size, consumed, tuned_added = _autotune_batch_size(vs, remaining)
+            remaining = remaining[consumed:]
+        total_added, total_batches = _ingest_batches(vs, remaining, batch_size)
+        total_added += tuned_added
 
         logger.info(
             f"Successfully added {total_added} documents in {total_batches} batches"
@@ -93,34 +526,20 @@ def add_documents(
             "Attempting to reset collection and retry with batches."
         )
 
-        # Delete the corrupted collection
+        # Delete the corrupted collection (the shared client stays open)
         try:
-            import chromadb
-
-            client = chromadb.PersistentClient(path=PERSIST_DIRECTORY)
-            try:
-                client.delete_collection(collection_name)
-                logger.info(f"Deleted corrupted collection: {collection_name}")
-            except Exception as del_err:
-                logger.warning(f"Could not delete collection: {del_err}")
-        except Exception as client_err:
-            logger.warning(f"Could not create ChromaDB client: {client_err}")
+            get_chroma_client().delete_collection(collection_name)
+            logger.info(f"Deleted corrupted collection: {collection_name}")
+        except Exception as del_err:
+            logger.warning(f"Could not delete collection: {del_err}")
+        # The cached handle points at the deleted collection
+        reset_cache(collection_name)
 
         # Recreate vectorstore and try again with batches
         vs = get_vectorstore(collection_name)
-        total_added = 0
-        total_batches = (len(documents) + BATCH_SIZE - 1) // BATCH_SIZE
-
-        for i in range(0, len(documents), BATCH_SIZE):
-            batch = documents[i : i + BATCH_SIZE]
-            batch_num = i // BATCH_SIZE + 1
-            logger.info(
-                f"Adding batch {batch_num}/{total_batches} ({len(batch)} documents) after reset"
-            )
-            vs.add_documents(batch)
-            total_added += len(batch)
-            # Persist بعد از هر batch
-            vs.persist()
+        total_added, total_batches = _ingest_batches(
+            vs, documents, batch_size, label=" after reset"
+        )
 
         logger.info(
             f"Successfully recreated collection and added {total_added} documents in {total_batches} batches"
@@ -128,6 +547,57 @@ def add_documents(
         return total_added
 
 
+# Aggregate chunk counts per source inside Chroma's SQLite metadata store
+_SOURCE_COUNTS_SQL = """
+SELECT em.string_value, COUNT(*)
+FROM embedding_metadata AS em
+JOIN embeddings AS e ON e.id = em.id
+JOIN segments AS s ON s.id = e.segment_id
+WHERE s.collection = ? AND em.key = 'source' AND em.string_value != ''
+GROUP BY em.string_value
+"""
+
+
+# Page size for the collection.get() fallback in get_stored_sources
+_SOURCES_PAGE_SIZE = 10_000
+
+
+def _count_sources_sql(collection) -> Optional[dict[str, int]]:
+    """Count chunks per source with a single GROUP BY on Chroma's SQLite file.
+
+    Returns:
+        Dictionary of source -> chunk count, or None if the database is not
+        available or its schema is not the one this query expects
+    """
+    db_path = Path(PERSIST_DIRECTORY) / "chroma.sqlite3"
+    if CHROMA_HOST or not db_path.exists():
+        # The database lives in the Chroma server, not on this host
+        return None
+
+    try:
+        conn = sqlite3.connect(f"{db_path.resolve().as_uri()}?mode=ro", uri=True)
+    except sqlite3.Error as e:
+        logger.debug(f"Could not open {db_path} read-only: {e}")
+        return None
+
+    try:
+        tables = {
+            row[0]
+            for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        }
+        if not {"embedding_metadata", "embeddings", "segments"} <= tables:
+            logger.debug(f"Unexpected Chroma schema in {db_path}; tables: {tables}")
+            return None
+        rows = conn.execute(_SOURCE_COUNTS_SQL, (str(collection.id),)).fetchall()
+    except sqlite3.Error as e:
+        logger.debug(f"Source count query failed: {e}")
+        return None
+    finally:
+        conn.close()
+
+    return dict(rows)
+
+
 def get_stored_sources(collection_name: str = "legal-texts") -> dict[str, int]:
     """
     دریافت لیست تمام فایل‌های ذخیره شده در vectordb به همراه تعداد chunks هر فایل.
@@ -155,52 +625,71 @@ def get_stored_sources(collection_name: str = "legal-texts") -> dict[str, int]:
             logger.info("Collection is empty")
             return {}
 
-        # دریافت همه metadata ها از collection
-        # استفاده از limit برای دریافت همه
-        try:
-            results = collection.get(limit=count if count else None)
-        except Exception as get_err:
-            logger.error(f"Error getting results: {get_err}")
-            # اگر با limit خطا داد، بدون limit امتحان کنیم
-            results = collection.get()
-
-        if not results:
-            logger.warning("No results from collection.get()")
-            return {}
-
-        metadatas = results.get("metadatas")
-        if not metadatas:
-            logger.warning("No metadatas in results")
-            logger.debug(
-                f"Results keys: {results.keys() if isinstance(results, dict) else 'Not a dict'}"
+        # Fast path: let SQLite aggregate instead of loading every chunk
+        source_counts = _count_sources_sql(collection)
+        if source_counts is not None:
+            logger.info(f"Found {len(source_counts)} unique sources")
+            return source_counts
+
+        # دریافت metadata ها به صورت صفحه‌به‌صفحه (بدون embedding و متن)
+        # تا مصرف حافظه به اندازه یک صفحه محدود بماند
+        source_counts: Counter[str] = Counter()
+        total_metadatas = 0
+        for offset in range(0, count, _SOURCES_PAGE_SIZE):
+            try:
+                results = collection.get(
+                    limit=_SOURCES_PAGE_SIZE, offset=offset, include=["metadatas"]
+                )
+            except Exception as get_err:
+                logger.error(f"Error getting results at offset {offset}: {get_err}")
+                break
+
+            metadatas = results.get("metadatas") if results else None
+            if not metadatas:
+                break
+            total_metadatas += len(metadatas)
+
+            # شمارش تعداد chunks برای هر source (Counter در لایه C می‌شمارد)
+            source_counts.update(
+                str(m["source"])
+                for m in metadatas
+                if isinstance(m, dict) and m.get("source")
             )
-            return {}
-
-        logger.info(f"Found {len(metadatas)} metadata entries")
-
-        # شمارش تعداد chunks برای هر source
-        source_counts: dict[str, int] = {}
-        for idx, metadata in enumerate(metadatas):
-            if metadata and isinstance(metadata, dict):
-                source_value = metadata.get("source")
-                if source_value:
-                    source = str(source_value)
-                    source_counts[source] = source_counts.get(source, 0) + 1
-                else:
-                    logger.debug(
-                        f"Metadata at index {idx} has no 'source' field: {metadata.keys()}"
-                    )
-            else:
-                logger.debug(f"Metadata at index {idx} is not a dict: {type(metadata)}")
-
+            if logger.isEnabledFor(logging.DEBUG):
+                for idx, metadata in enumerate(metadatas, start=offset):
+                    if not (isinstance(metadata, dict) and metadata.get("source")):
+                        logger.debug(
+                            f"Metadata at index {idx} has no 'source': {metadata}"
+                        )
+
+        logger.info(f"Found {total_metadatas} metadata entries")
         logger.info(f"Found {len(source_counts)} unique sources")
-        return source_counts
+        return dict(source_counts)
 
     except Exception as e:
         logger.error(f"Error getting stored sources: {e}", exc_info=True)
         return {}
 
 
+def set_search_ef(
+    collection_name: str = "legal-texts", ef_search: int = CHROMA_SEARCH_EF
+) -> dict:
+    """Raise HNSW ef_search on a collection once bulk ingestion is done.
+
+    ef_search only affects queries, so it can be changed after the index is
+    built without re-inserting anything.
+
+    Returns:
+        The collection's HNSW configuration after the change
+    """
+    collection = get_vectorstore(collection_name)._collection
+    collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+    logger.info(f"Set hnsw ef_search={ef_search} on collection '{collection_name}'")
+    # Re-read the collection so the returned configuration is the stored one
+    stored = get_chroma_client().get_collection(collection_name)
+    return dict(stored.configuration["hnsw"])
+
+
 def stats(collection_name: str = "legal-texts") -> dict:
     vs = get_vectorstore(collection_name)
     try:
@@ -13,104 +13,162 @@ Run:
 
 from __future__ import annotations
 
+import os
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import shutil
-import requests
 import sys
 
+import httpx
+
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 SOURCE_ROOT = BASE_DIR / "data" / "ghavanin"
 STAGING_DIR = SOURCE_ROOT / "New folder"
 ARCHIVE_ROOT = BASE_DIR / "data" / "uploadwithscript"
 API_URL = "http://localhost:4000/rag/upload-folder-from-path"
+# Called once after the last batch to switch the index to query parameters
+TUNE_URL = "http://localhost:4000/rag/tune-search"
 BATCH_SIZE = 10
 API_TIMEOUT = 900  # 15 minutes timeout
 MAX_RETRIES = 3
-RETRY_DELAY = 5  # seconds between retries
+RETRY_DELAY = 5  # seconds before the first retry, doubled after each failure
+MAX_RETRY_DELAY = 60
 
 # Relative path expected by API (from project root)
 API_FOLDER_PATH = "./data/ghavanin/New folder"
 
+# Parallel file moves (overlaps filesystem latency on NFS / slow disks)
+MOVE_WORKERS = 8
+
+# One pooled client for all batches, so keep-alive connections are reused
+# (HTTP/2 is not enabled: the API is served over plain HTTP, where httpx only
+# speaks HTTP/1.1)
+_HTTP = httpx.Client(
+    timeout=httpx.Timeout(API_TIMEOUT),
+    limits=httpx.Limits(max_keepalive_connections=4),
+)
+
+# Source files still to be uploaded; scanned once in main(), consumed from the
+# front by take_batch (popleft is O(1), unlike deleting a list prefix)
+_PENDING: deque[Path] = deque()
+
 
 def ensure_dirs() -> None:
     STAGING_DIR.mkdir(parents=True, exist_ok=True)
     ARCHIVE_ROOT.mkdir(parents=True, exist_ok=True)
 
 
-def iter_source_files():
+def iter_source_files(root: Path = SOURCE_ROOT):
     """
-    Yield all files under SOURCE_ROOT except those already in staging/archived.
+    Yield all files under root except those already in staging/archived.
+
+    Uses os.scandir so file types come from the directory listing instead of
+    one stat() call per entry.
     """
-    for path in SOURCE_ROOT.rglob("*"):
-        if not path.is_file():
-            continue
-        if STAGING_DIR in path.parents:
-            continue
-        if ARCHIVE_ROOT in path.parents:
-            continue
-        yield path
+    # Pruning these directories skips everything below them
+    excluded = {str(STAGING_DIR), str(ARCHIVE_ROOT)}
+    stack = [str(root)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.path not in excluded:
+                        stack.append(entry.path)
+                elif entry.is_file():
+                    yield Path(entry.path)
 
 
 def take_batch(batch_size: int):
-    files = list(iter_source_files())
-    return files[:batch_size]
+    return [_PENDING.popleft() for _ in range(min(batch_size, len(_PENDING)))]
+
+
+def _fast_move(src: Path, dst: Path) -> None:
+    """Rename in one syscall; fall back to copy+delete across filesystems."""
+    try:
+        os.replace(src, dst)
+    except OSError:
+        shutil.move(str(src), str(dst))
+
+
+def _move_all(pairs) -> None:
+    """Move (source, target) pairs using a thread pool."""
+    with ThreadPoolExecutor(max_workers=MOVE_WORKERS) as pool:
+        # list() re-raises the first failed move
+        list(pool.map(lambda pair: _fast_move(*pair), pairs))
 
 
 def move_files(files, destination: Path):
     destination.mkdir(parents=True, exist_ok=True)
+    # Resolve targets serially so duplicate names within the batch don't collide
+    taken = set()
+    pairs = []
     for f in files:
         target = destination / f.name
         # If duplicate names appear, append a counter
-        if target.exists():
+        if target in taken or target.exists():
             stem, suffix = f.stem, f.suffix
             counter = 1
             while True:
                 alt = destination / f"{stem}_{counter}{suffix}"
-                if not alt.exists():
+                if alt not in taken and not alt.exists():
                     target = alt
                     break
                 counter += 1
-        shutil.move(str(f), target)
+        taken.add(target)
+        pairs.append((f, target))
+    _move_all(pairs)
     return list(destination.iterdir())
 
 
-def call_api(retry_count=0):
+def call_api():
     """
     Call the upload API with retry logic and extended timeout.
-    """
-    try:
-        print(
-            f"  API call attempt {retry_count + 1}/{MAX_RETRIES} (timeout: {API_TIMEOUT}s)..."
-        )
-        start_time = time.time()
 
-        resp = requests.post(
-            API_URL,
-            json={"folder_path": API_FOLDER_PATH, "recursive": True},
-            timeout=API_TIMEOUT,
-        )
+    Retries reuse the pooled client's connection and back off exponentially
+    (RETRY_DELAY, 2x, 4x, ... capped at MAX_RETRY_DELAY).
+    """
+    for attempt in range(MAX_RETRIES):
+        try:
+            print(
+                f"  API call attempt {attempt + 1}/{MAX_RETRIES} (timeout: {API_TIMEOUT}s)..."
+            )
+            start_time = time.time()
+
+            resp = _HTTP.post(
+                API_URL,
+                json={"folder_path": API_FOLDER_PATH, "recursive": True},
+            )
+
+            elapsed = time.time() - start_time
+            print(f"  API call completed in {elapsed:.1f} seconds")
+
+            resp.raise_for_status()
+            return resp.json()
+        except httpx.HTTPError as e:
+            if attempt == MAX_RETRIES - 1:
+                if isinstance(e, httpx.TimeoutException):
+                    raise Exception(f"API timeout after {MAX_RETRIES} attempts: {e}")
+                raise
+            delay = min(RETRY_DELAY * 2**attempt, MAX_RETRY_DELAY)
+            if isinstance(e, httpx.TimeoutException):
+                print(f"  Timeout occurred. Retrying in {delay} seconds...")
+            else:
+                print(f"  Request failed: {e}. Retrying in {delay} seconds...")
+            time.sleep(delay)
 
-        elapsed = time.time() - start_time
-        print(f"  API call completed in {elapsed:.1f} seconds")
 
+def tune_search_index() -> None:
+    """Ask the API to raise HNSW ef_search now that bulk ingestion is done."""
+    try:
+        resp = _HTTP.post(TUNE_URL)
         resp.raise_for_status()
-        return resp.json()
-    except requests.exceptions.Timeout as e:
-        if retry_count < MAX_RETRIES - 1:
-            print(f"  Timeout occurred. Retrying in {RETRY_DELAY} seconds...")
-            time.sleep(RETRY_DELAY)
-            return call_api(retry_count + 1)
-        else:
-            raise Exception(f"API timeout after {MAX_RETRIES} attempts: {e}")
-    except requests.exceptions.RequestException as e:
-        if retry_count < MAX_RETRIES - 1:
-            print(f"  Request failed: {e}. Retrying in {RETRY_DELAY} seconds...")
-            time.sleep(RETRY_DELAY)
-            return call_api(retry_count + 1)
-        else:
-            raise
+        print(f"✓ Search index tuned: {resp.json().get('hnsw')}")
+    except httpx.HTTPError as e:
+        # Not fatal: queries still work with the default parameters
+        print(f"⚠ Could not tune search index: {e}")
 
 
 def archive_all_from_staging():
@@ -133,12 +191,18 @@ def archive_all_from_staging():
         return dest_dir
 
     print(f"  Archiving {len(all_staged_files)} files from staging folder...")
+    pairs = []
+    created_dirs = {dest_dir}
     for f in all_staged_files:
         # Preserve relative path structure if files are in subdirectories
         relative_path = f.relative_to(STAGING_DIR)
         target = dest_dir / relative_path
-        target.parent.mkdir(parents=True, exist_ok=True)
-        shutil.move(str(f), target)
+        # Create each destination directory once, not once per file
+        if target.parent not in created_dirs:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            created_dirs.add(target.parent)
+        pairs.append((f, target))
+    _move_all(pairs)
 
     # Remove empty subdirectories from staging
     for path in sorted(STAGING_DIR.rglob("*"), reverse=True):
@@ -154,9 +218,9 @@ def archive_all_from_staging():
 def main():
     ensure_dirs()
 
-    # Count total files first
-    all_files = list(iter_source_files())
-    total_files = len(all_files)
+    # Scan the source tree once; batches are taken from this list
+    _PENDING.extend(iter_source_files())
+    total_files = len(_PENDING)
     print(f"Total files to process: {total_files}")
     print(f"Batch size: {BATCH_SIZE}")
     print(f"Estimated batches: {(total_files + BATCH_SIZE - 1) // BATCH_SIZE}")
@@ -177,6 +241,7 @@ def main():
             print("All files processed successfully!")
             print(f"Total batches: {batch_num}")
             print(f"Total files processed: {processed_files}")
+            tune_search_index()
             break
 
         batch_num += 1
@@ -15,45 +15,122 @@ Workflow per batch:
 2) Call the RAG upload API with that staging folder.
 3) Move the processed files into data/uploadwithscript/<batch_xxx>/.
 
+With --upload-mode stream, steps 1 and 3 collapse: the batch files are posted
+as a multipart upload to /rag/upload and then archived straight from the
+source tree, without the staging folder.
+
 Run:
     python scripts/optimized_batch_upload.py
+    python scripts/optimized_batch_upload.py --upload-mode stream
     python scripts/optimized_batch_upload.py --batch-size 20
+    python scripts/optimized_batch_upload.py --auto-tune
     python scripts/optimized_batch_upload.py --resume
 """
 
 from __future__ import annotations
 
 import argparse
+import errno
+import glob
 import json
+import os
+import random
 import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import ExitStack
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
+from typing import Iterator
 import shutil
-import requests
 import sys
 
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 SOURCE_ROOT = BASE_DIR / "data" / "ghavanin"
 STAGING_DIR = SOURCE_ROOT / "New folder"
 ARCHIVE_ROOT = BASE_DIR / "data" / "uploadwithscript"
 PROGRESS_FILE = BASE_DIR / "scripts" / "upload_progress.json"
+# Append-only journal of processed file paths (one JSON string per line);
+# PROGRESS_FILE only holds the small counters header
+PROGRESS_JOURNAL = BASE_DIR / "scripts" / "upload_progress.jsonl"
 
 # Default settings
 DEFAULT_BATCH_SIZE = 10
+# Batch sizes tried (one batch each, in order) by --auto-tune
+AUTOTUNE_SIZES = (4, 8, 16, 32, 64)
 DEFAULT_API_URL = "http://localhost:4000/rag/upload-folder-from-path"
+# Multipart endpoint used by --upload-mode stream
+DEFAULT_STREAM_URL = "http://localhost:4000/rag/upload"
 DEFAULT_API_TIMEOUT = 900  # 15 minutes
 DEFAULT_MAX_RETRIES = 3
-DEFAULT_RETRY_DELAY = 5  # seconds
+DEFAULT_RETRY_DELAY = 5  # seconds before the first retry, doubled after each failure
+MAX_RETRY_DELAY = 60
+RETRY_JITTER = 1.0  # up to this many seconds added to each retry delay
+# Parallel file moves per batch. Moves are mostly single rename() calls, so a
+# thread pool is enough to overlap them; io_uring batching (liburing) was
+# considered but not used: it is Linux-only, needs a native extension, and
+# rename is metadata-only, so there is little syscall overhead left to batch.
+MAX_MOVE_WORKERS = 32
 
 # Relative path expected by API (from project root)
 API_FOLDER_PATH = "./data/ghavanin/New folder"
 
 
+# One keep-alive session for all batches. Retries are handled in call_api, so
+# the adapter itself never retries (max_retries=0 keeps read timeouts raised
+# as requests.Timeout).
+SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0)
+SESSION.mount("http://", _ADAPTER)
+SESSION.mount("https://", _ADAPTER)
+SESSION.headers["Connection"] = "keep-alive"
+# Compressed responses: zstd when urllib3 can decode it here (the zstandard
+# package is installed), otherwise gzip. Request bodies are sent as is; the
+# API does not decode Content-Encoding on uploads.
+SESSION.headers["Accept-Encoding"] = ", ".join(
+    e for e in ("zstd", "gzip") if e in ACCEPT_ENCODING.split(",")
+)
+
+
+def _read_journal() -> list[str]:
+    """Read processed file paths from the progress journal."""
+    if not PROGRESS_JOURNAL.exists():
+        return []
+    processed = []
+    with open(PROGRESS_JOURNAL, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                processed.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A torn last line from an interrupted append; skip it
+                print(f"Warning: Skipping corrupt progress journal line: {line!r}")
+    return processed
+
+
+def _append_journal(paths) -> None:
+    """Append processed file paths to the progress journal."""
+    PROGRESS_JOURNAL.parent.mkdir(parents=True, exist_ok=True)
+    with open(PROGRESS_JOURNAL, "a", encoding="utf-8") as f:
+        f.writelines(json.dumps(p, ensure_ascii=False) + "\n" for p in paths)
+
+
+def clear_progress() -> None:
+    """Remove the progress header and journal."""
+    for path in (PROGRESS_FILE, PROGRESS_JOURNAL):
+        if path.exists():
+            path.unlink()
+
+
 def load_progress() -> dict:
-    """Load progress from JSON file if it exists."""
+    """Load progress from the header JSON file and journal if they exist."""
     default_progress = {
-        "processed_files": [],
+        "processed_files": set(),
         "total_files": 0,
         "batches_completed": 0,
         "last_update": None,
@@ -79,179 +156,340 @@ def load_progress() -> dict:
                 else:
                     # New format - merge with defaults to ensure all keys exist
                     default_progress.update(loaded)
-
-                return default_progress
         except (json.JSONDecodeError, IOError) as e:
             print(f"Warning: Could not load progress file: {e}")
+            return default_progress
+
+        # Headers written before the journal existed carry the full list;
+        # move it into the journal so later header writes stay small
+        if default_progress["processed_files"]:
+            try:
+                _append_journal(default_progress["processed_files"])
+                save_progress(default_progress)
+            except IOError as e:
+                print(f"Warning: Could not migrate progress file: {e}")
+        # Kept as a set in memory: O(1) membership and no duplicates
+        default_progress["processed_files"] = set(
+            default_progress["processed_files"] or _read_journal()
+        )
 
     return default_progress
 
 
-def save_progress(progress: dict) -> None:
-    """Save progress to JSON file."""
+def save_progress(progress: dict, new_files=()) -> None:
+    """
+    Checkpoint progress: append new_files to the journal and atomically
+    rewrite the header (write to a temp file, then os.replace), so a crash
+    never leaves a half-written progress file.
+    """
     progress["last_update"] = datetime.now().isoformat()
+    header = {k: v for k, v in progress.items() if k != "processed_files"}
     try:
+        if new_files:
+            _append_journal(new_files)
         PROGRESS_FILE.parent.mkdir(parents=True, exist_ok=True)
-        with open(PROGRESS_FILE, "w", encoding="utf-8") as f:
-            json.dump(progress, f, indent=2, ensure_ascii=False)
+        tmp = PROGRESS_FILE.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(header, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, PROGRESS_FILE)
     except IOError as e:
         print(f"Warning: Could not save progress file: {e}")
 
 
-def ensure_dirs() -> None:
-    """Ensure all required directories exist."""
-    STAGING_DIR.mkdir(parents=True, exist_ok=True)
+# Destinations already known to exist and be writable (probed once per run)
+_destinations_checked: set[Path] = set()
+
+
+def _check_destination(destination: Path) -> Path:
+    """Create destination and verify it is writable, once per directory."""
+    destination = destination.resolve()
+    if destination in _destinations_checked:
+        return destination
+    destination.mkdir(parents=True, exist_ok=True)
+
+    # Test if destination is writable
+    test_file = destination / ".test_write"
+    try:
+        test_file.touch()
+        test_file.unlink()
+    except (OSError, PermissionError) as e:
+        raise Exception(f"Destination directory is not writable: {destination} - {e}")
+    _destinations_checked.add(destination)
+    return destination
+
+
+def staging_dir(slot: int = 0) -> Path:
+    """Staging folder for a concurrent batch slot (slot 0 is STAGING_DIR)."""
+    if slot == 0:
+        return STAGING_DIR
+    return STAGING_DIR.with_name(f"{STAGING_DIR.name}_{slot}")
+
+
+def _api_folder_path(staging: Path) -> str:
+    """Folder path for the API, relative to the project root."""
+    if staging == STAGING_DIR:
+        return API_FOLDER_PATH
+    return "./" + staging.relative_to(BASE_DIR).as_posix()
+
+
+def _excluded_dirs() -> frozenset[str]:
+    """Directories never scanned for source files: staging slots and archive."""
+    staging = [STAGING_DIR]
+    # Extra slots from --parallel-batches (this run's or an earlier one's)
+    staging.extend(SOURCE_ROOT.glob(f"{glob.escape(STAGING_DIR.name)}_[0-9]*"))
+    return frozenset(map(str, (*staging, ARCHIVE_ROOT)))
+
+
+def ensure_dirs(staging_count: int = 1) -> None:
+    """Ensure all required directories exist (and are writable)."""
+    for slot in range(staging_count):
+        _check_destination(staging_dir(slot))
     ARCHIVE_ROOT.mkdir(parents=True, exist_ok=True)
 
 
-def iter_source_files(processed_files: set[str] | None = None):
+def _scandir_recursive(path: Path | str, exclude: frozenset[str] = frozenset()):
+    """
+    Yield os.DirEntry objects for all files under path.
+
+    File/directory checks use the type cached by scandir (no extra stat()
+    per entry). Symlinks are skipped, as are directories whose path is in
+    exclude. Unreadable directories are reported and skipped.
+    """
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_symlink():
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.path not in exclude:
+                        yield from _scandir_recursive(entry.path, exclude)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+    except PermissionError as e:
+        print(f"  ⚠ Warning: Cannot read directory {path}: {e}")
+
+
+def _is_processed(
+    entry: os.DirEntry, processed_files: frozenset[str], legacy_format: bool
+) -> bool:
+    """Whether a file was already uploaded (by full path, or by name for the
+    old progress format that stored only file names)."""
+    if entry.path in processed_files:
+        return True
+    return legacy_format and entry.name in processed_files
+
+
+def iter_source_files(
+    processed_files: frozenset[str] = frozenset(), legacy_format: bool = False
+):
     """
     Yield all files under SOURCE_ROOT except those already in staging/archived.
     Optionally skip files that have already been processed.
-    Handles both full paths (new format) and file names (old format).
-    """
-    if processed_files is None:
-        processed_files = set()
+    Handles both full paths (new format) and file names (legacy_format).
 
-    for path in SOURCE_ROOT.rglob("*"):
-        if not path.is_file():
-            continue
-        if STAGING_DIR in path.parents:
-            continue
-        if ARCHIVE_ROOT in path.parents:
-            continue
-        # Skip already processed files - check both full path and file name
-        # (old format had just names, new format has full paths)
-        if str(path) in processed_files or path.name in processed_files:
+    Yields (path, stat_result) tuples; the stat is taken once here and reused
+    for size reporting instead of re-stat'ing each file later.
+    """
+    exclude = _excluded_dirs()
+    for entry in _scandir_recursive(SOURCE_ROOT, exclude):
+        if _is_processed(entry, processed_files, legacy_format):
             continue
-        yield path
+        try:
+            st = entry.stat()
+        except OSError:
+            continue  # Removed since the directory was listed
+        yield Path(entry.path), st
+
+
+def count_source_files(
+    processed_files: frozenset[str] = frozenset(), legacy_format: bool = False
+) -> int:
+    """
+    Count the files iter_source_files would yield, for progress reporting.
+
+    Uses only the directory listings (no Path objects, no stat() calls).
+    """
+    exclude = _excluded_dirs()
+    return sum(
+        1
+        for entry in _scandir_recursive(SOURCE_ROOT, exclude)
+        if not _is_processed(entry, processed_files, legacy_format)
+    )
+
+
+def size_mb(st: os.stat_result) -> float:
+    """File size in MB from a cached stat result."""
+    return st.st_size / (1024 * 1024)
+
 
+def take_batch(
+    files: Iterator[tuple[Path, os.stat_result]], batch_size: int
+) -> list[tuple[Path, os.stat_result]]:
+    """Take the next batch of files from the source iterator."""
+    return list(islice(files, batch_size))
 
-def get_file_size_mb(path: Path) -> float:
-    """Get file size in MB."""
+
+def _copy_file(source: str, target: str) -> None:
+    """Copy file contents and metadata, in-kernel via sendfile where available."""
+    # File-to-file sendfile is Linux-only (elsewhere the target must be a socket)
+    if not sys.platform.startswith("linux"):
+        shutil.copy2(source, target)
+        return
+
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        remaining = os.fstat(src.fileno()).st_size
+        offset = 0
+        while remaining > 0:
+            sent = os.sendfile(dst.fileno(), src.fileno(), offset, remaining)
+            if sent == 0:
+                break
+            offset += sent
+            remaining -= sent
+    shutil.copystat(source, target)
+
+
+def _move_one(source_path: Path, target: Path) -> Path:
+    """Move one file to its reserved target, with a copy+delete fallback."""
     try:
-        return path.stat().st_size / (1024 * 1024)
-    except OSError:
-        return 0.0
+        # Check path lengths (Windows has 260 char limit, but can be extended)
+        source_str = str(source_path)
+        target_str = str(target)
+
+        if len(source_str) > 260 or len(target_str) > 260:
+            print(
+                f"  ⚠ Warning: Long path detected (source: {len(source_str)}, target: {len(target_str)} chars)"
+            )
+
+        # Try to move the file: a single atomic rename on the same filesystem
+        try:
+            os.replace(source_str, target_str)
+        except OSError as move_error:
+            if move_error.errno == errno.EXDEV:
+                print(f"  Cross-device move, copying {source_path.name}")
+            else:
+                # Fallback: try copy + delete (sometimes works better on Windows)
+                print(
+                    f"  ⚠ Move failed, trying copy+delete for {source_path.name}: {move_error}"
+                )
+            try:
+                _copy_file(source_str, target_str)
+                # Verify copy was successful before deleting source
+                if (
+                    target.exists()
+                    and target.stat().st_size == source_path.stat().st_size
+                ):
+                    source_path.unlink()
+                else:
+                    raise Exception("Copy verification failed - file sizes don't match")
+            except Exception as copy_error:
+                print(
+                    f"  ✗ Copy+delete also failed for {source_path.name}: {copy_error}"
+                )
+                raise move_error from copy_error
+
+        return target
+    except FileNotFoundError as e:
+        print(f"  ✗ FileNotFoundError moving {source_path.name}: {e}")
+        print(f"    Source exists: {source_path.exists()}")
+        print(f"    Source path: {source_path}")
+        print(f"    Target parent exists: {target.parent.exists()}")
+        print(f"    Target path: {target}")
+        raise
+    except (OSError, shutil.Error) as e:
+        print(f"  ✗ Error moving file {source_path.name}: {e}")
+        print(f"    Source path: {source_path}")
+        print(f"    Target path: {target}")
+        print(f"    Error type: {type(e).__name__}")
+        print(f"    Error code: {e.winerror if hasattr(e, 'winerror') else 'N/A'}")
+        raise
+
 
+def _move_all(pairs: list[tuple[Path, Path]]) -> list[Path]:
+    """Run _move_one over (source, target) pairs in a thread pool.
 
-def take_batch(files: list[Path], batch_size: int) -> list[Path]:
-    """Take the next batch of files."""
-    return files[:batch_size]
+    File moves are blocking syscalls that release the GIL, so running them
+    concurrently overlaps filesystem latency. Raises the first failure.
+    """
+    if not pairs:
+        return []
+    with ThreadPoolExecutor(max_workers=min(MAX_MOVE_WORKERS, len(pairs))) as pool:
+        return list(pool.map(lambda pair: _move_one(*pair), pairs))
+
+
+def check_batch(
+    batch: list[tuple[Path, os.stat_result]],
+) -> tuple[list[tuple[Path, os.stat_result]], list[str]]:
+    """Split a batch into files that still exist and names of missing ones."""
+    existing, missing = [], []
+    for f, st in batch:
+        if f.is_file():
+            existing.append((f, st))
+        else:
+            missing.append(f.name)
+    return existing, missing
 
 
 def move_files(files: list[Path], destination: Path) -> list[Path]:
     """Move files to destination directory, handling duplicates."""
-    # Ensure destination exists and is accessible
+    # Ensure destination exists and is accessible (skipped after the first
+    # check of this directory, normally done by ensure_dirs)
     try:
-        destination = destination.resolve()
-        destination.mkdir(parents=True, exist_ok=True)
-
-        # Test if destination is writable
-        test_file = destination / ".test_write"
-        try:
-            test_file.touch()
-            test_file.unlink()
-        except (OSError, PermissionError) as e:
-            raise Exception(
-                f"Destination directory is not writable: {destination} - {e}"
-            )
+        destination = _check_destination(destination)
     except Exception as e:
         print(f"  ✗ Cannot access destination directory {destination}: {e}")
         raise
 
-    moved_files = []
-
+    # Reserve unique target names serially, then move in parallel. Names are
+    # checked against one directory listing instead of an exists() per name
+    pairs = []
+    existing = set(os.listdir(destination))
+    # Paths come from scanning SOURCE_ROOT / STAGING_DIR, which hang off the
+    # already-resolved BASE_DIR, so they are absolute without a per-file
+    # resolve() (a realpath walk over every path component)
     for f in files:
-        # Resolve paths to absolute paths to avoid issues
-        try:
-            source_path = f.resolve()
-        except (OSError, ValueError) as e:
-            print(f"  ⚠ Warning: Cannot resolve source path {f}: {e}")
-            continue
-
-        # Check if source file exists
-        if not source_path.exists():
-            print(f"  ⚠ Warning: Source file does not exist, skipping: {source_path}")
+        # One stat: a missing file and a non-file are both skipped
+        if not f.is_file():
+            reason = "is not a file" if f.exists() else "does not exist"
+            print(f"  ⚠ Warning: Source {reason}, skipping: {f}")
             continue
 
-        if not source_path.is_file():
-            print(f"  ⚠ Warning: Source is not a file, skipping: {source_path}")
-            continue
-
-        target = destination / f.name
-        # If duplicate names appear, append a counter
-        if target.exists():
+        target_name = f.name
+        # If duplicate names appear (on disk or earlier in this batch), append a counter
+        if target_name in existing:
             stem, suffix = f.stem, f.suffix
             counter = 1
-            while True:
-                alt = destination / f"{stem}_{counter}{suffix}"
-                if not alt.exists():
-                    target = alt
-                    break
+            while f"{stem}_{counter}{suffix}" in existing:
                 counter += 1
+            target_name = f"{stem}_{counter}{suffix}"
+        existing.add(target_name)
+        pairs.append((f, destination / target_name))
 
-        try:
-            # Ensure target directory exists
-            target.parent.mkdir(parents=True, exist_ok=True)
+    return _move_all(pairs)
 
-            # Resolve target to absolute path
-            target = target.resolve()
 
-            # Check path lengths (Windows has 260 char limit, but can be extended)
-            source_str = str(source_path)
-            target_str = str(target)
+def _post_files(api_url: str, files: list[Path], api_timeout: int):
+    """POST files as a multipart upload (field "files", as /rag/upload expects).
 
-            if len(source_str) > 260 or len(target_str) > 260:
-                print(
-                    f"  ⚠ Warning: Long path detected (source: {len(source_str)}, target: {len(target_str)} chars)"
-                )
-
-            # Try to move the file
-            try:
-                shutil.move(source_str, target_str)
-            except (FileNotFoundError, OSError) as move_error:
-                # Fallback: try copy + delete (sometimes works better on Windows)
-                print(f"  ⚠ Move failed, trying copy+delete for {f.name}: {move_error}")
-                try:
-                    shutil.copy2(source_str, target_str)
-                    # Verify copy was successful before deleting source
-                    if (
-                        target.exists()
-                        and target.stat().st_size == source_path.stat().st_size
-                    ):
-                        source_path.unlink()
-                    else:
-                        raise Exception(
-                            "Copy verification failed - file sizes don't match"
-                        )
-                except Exception as copy_error:
-                    print(f"  ✗ Copy+delete also failed for {f.name}: {copy_error}")
-                    raise move_error from copy_error
-
-            moved_files.append(target)
-        except FileNotFoundError as e:
-            print(f"  ✗ FileNotFoundError moving {f.name}: {e}")
-            print(f"    Source exists: {source_path.exists()}")
-            print(f"    Source path: {source_path}")
-            print(
-                f"    Source absolute: {source_path.resolve() if source_path.exists() else 'N/A'}"
-            )
-            print(f"    Target parent exists: {target.parent.exists()}")
-            print(f"    Target path: {target}")
-            raise
-        except (OSError, shutil.Error) as e:
-            print(f"  ✗ Error moving file {f.name}: {e}")
-            print(f"    Source path: {source_path}")
-            print(
-                f"    Source absolute: {source_path.resolve() if source_path.exists() else 'N/A'}"
-            )
-            print(f"    Target path: {target}")
-            print(f"    Error type: {type(e).__name__}")
-            print(f"    Error code: {e.winerror if hasattr(e, 'winerror') else 'N/A'}")
-            raise
-
-    return moved_files
+    With requests_toolbelt installed the body is streamed from the open file
+    handles; otherwise requests assembles it in memory, which is fine for
+    batch-sized uploads.
+    """
+    with ExitStack() as stack:
+        fields = [
+            ("files", (f.name, stack.enter_context(open(f, "rb"))))
+            for f in files
+        ]
+        try:
+            from requests_toolbelt import MultipartEncoder
+        except ImportError:
+            return SESSION.post(api_url, files=fields, timeout=api_timeout)
+        encoder = MultipartEncoder(fields=fields)
+        return SESSION.post(
+            api_url,
+            data=encoder,
+            headers={"Content-Type": encoder.content_type},
+            timeout=api_timeout,
+        )
 
 
 def call_api(
@@ -259,84 +497,147 @@ def call_api(
     api_timeout: int,
     max_retries: int,
     retry_delay: int,
-    retry_count: int = 0,
+    files: list[Path] | None = None,
+    staged: list[str] | None = None,
+    folder_path: str | None = None,
 ) -> dict:
     """
     Call the upload API with retry logic and extended timeout.
+
+    Without files, the API is pointed at the staging folder (folder_path,
+    API_FOLDER_PATH by default); staged names the
+    files in it (relative paths) so the server can skip scanning the folder.
+    With files, they are uploaded directly (stream mode). Retries back off
+    exponentially (retry_delay, 2x, 4x, ... capped at MAX_RETRY_DELAY) plus
+    random jitter so concurrent runs don't retry in lockstep.
     """
-    try:
-        print(
-            f"  API call attempt {retry_count + 1}/{max_retries} (timeout: {api_timeout}s)..."
-        )
-        start_time = time.time()
+    max_retries = max(max_retries, 1)  # always make at least one attempt
+    for attempt in range(max_retries):
+        try:
+            print(
+                f"  API call attempt {attempt + 1}/{max_retries} (timeout: {api_timeout}s)..."
+            )
+            start_time = time.monotonic()
+
+            if files is None:
+                payload = {
+                    "folder_path": folder_path or API_FOLDER_PATH,
+                    "recursive": True,
+                }
+                if staged is not None:
+                    payload["files"] = staged
+                resp = SESSION.post(api_url, json=payload, timeout=api_timeout)
+            else:
+                resp = _post_files(api_url, files, api_timeout)
+
+            elapsed = time.monotonic() - start_time
+            print(f"  API call completed in {elapsed:.1f} seconds")
+
+            resp.raise_for_status()
+            return resp.json()
+        except requests.exceptions.RequestException as e:
+            timed_out = isinstance(e, requests.exceptions.Timeout)
+            if attempt == max_retries - 1:
+                if timed_out:
+                    raise Exception(f"API timeout after {max_retries} attempts: {e}")
+                raise
+            delay = min(retry_delay * 2**attempt, MAX_RETRY_DELAY)
+            delay += random.uniform(0, RETRY_JITTER)
+            if timed_out:
+                print(f"  Timeout occurred. Retrying in {delay:.1f} seconds...")
+            else:
+                print(f"  Request failed: {e}. Retrying in {delay:.1f} seconds...")
+            time.sleep(delay)
 
-        resp = requests.post(
-            api_url,
-            json={"folder_path": API_FOLDER_PATH, "recursive": True},
-            timeout=api_timeout,
-        )
 
-        elapsed = time.time() - start_time
-        print(f"  API call completed in {elapsed:.1f} seconds")
-
-        resp.raise_for_status()
-        return resp.json()
-    except requests.exceptions.Timeout as e:
-        if retry_count < max_retries - 1:
-            print(f"  Timeout occurred. Retrying in {retry_delay} seconds...")
-            time.sleep(retry_delay)
-            return call_api(
-                api_url, api_timeout, max_retries, retry_delay, retry_count + 1
-            )
-        else:
-            raise Exception(f"API timeout after {max_retries} attempts: {e}")
-    except requests.exceptions.RequestException as e:
-        if retry_count < max_retries - 1:
-            print(f"  Request failed: {e}. Retrying in {retry_delay} seconds...")
-            time.sleep(retry_delay)
-            return call_api(
-                api_url, api_timeout, max_retries, retry_delay, retry_count + 1
-            )
-        else:
-            raise
+def _new_archive_dir() -> Path:
+    """Create a fresh timestamped batch directory under ARCHIVE_ROOT."""
+    ts = time.strftime("batch_%Y%m%d_%H%M%S")
+    dest_dir = ARCHIVE_ROOT / ts
+    # Batches finishing within the same second must not share (and overwrite
+    # files in) one archive directory
+    counter = 1
+    while True:
+        try:
+            dest_dir.mkdir(parents=True)
+            break
+        except FileExistsError:
+            dest_dir = ARCHIVE_ROOT / f"{ts}_{counter}"
+            counter += 1
+    return dest_dir
+
+
+def archive_from_source(files: list[Path]) -> tuple[Path, list[Path]]:
+    """Move uploaded files straight from the source tree to a new archive
+    directory (stream mode; nothing passes through STAGING_DIR)."""
+    dest_dir = _new_archive_dir()
+    return dest_dir, move_files(files, dest_dir)
 
 
-def archive_all_from_staging() -> Path:
+def list_staged_files(staging: Path | None = None) -> list[str]:
+    """Paths of all files in a staging folder (STAGING_DIR by default),
+    relative to it (POSIX form)."""
+    staging = staging or STAGING_DIR
+    prefix_len = len(str(staging)) + 1
+    return [
+        entry.path[prefix_len:].replace(os.sep, "/")
+        for entry in _scandir_recursive(staging)
+    ]
+
+
+def archive_all_from_staging(staging: Path | None = None) -> tuple[Path, int, int]:
     """
-    Move ALL files from STAGING_DIR to archive directory.
-    This ensures New folder is completely emptied after successful API call.
+    Move ALL files from a staging folder (STAGING_DIR by default) to archive
+    directory. This ensures New folder is completely emptied after successful
+    API call.
+
+    Returns:
+        Tuple of (archive directory, files archived, files left in staging)
     """
-    ts = time.strftime("batch_%Y%m%d_%H%M%S")
-    dest_dir = ARCHIVE_ROOT / ts
-    dest_dir.mkdir(parents=True, exist_ok=True)
+    staging = staging or STAGING_DIR
+    dest_dir = _new_archive_dir()
 
     # Get all files in staging directory (including subdirectories if recursive)
-    all_staged_files = []
-    for path in STAGING_DIR.rglob("*"):
-        if path.is_file():
-            all_staged_files.append(path)
+    all_staged_files = [entry.path for entry in _scandir_recursive(staging)]
 
     if not all_staged_files:
         print("  No files found in staging folder to archive.")
-        return dest_dir
+        return dest_dir, 0, 0
 
     print(f"  Archiving {len(all_staged_files)} files from staging folder...")
-    for f in all_staged_files:
+    # Relative paths by slicing off the staging prefix (entries all lie under
+    # it) instead of Path.relative_to, and one mkdir per distinct
+    # subdirectory rather than per file
+    prefix_len = len(str(staging)) + 1
+    dest_str = str(dest_dir)
+    made_dirs = {dest_str}
+    pairs = []
+    for path in all_staged_files:
         # Preserve relative path structure if files are in subdirectories
-        relative_path = f.relative_to(STAGING_DIR)
-        target = dest_dir / relative_path
-        target.parent.mkdir(parents=True, exist_ok=True)
-        shutil.move(str(f), target)
-
-    # Remove empty subdirectories from staging
-    for path in sorted(STAGING_DIR.rglob("*"), reverse=True):
-        if path.is_dir() and path != STAGING_DIR:
+        target = os.path.join(dest_str, path[prefix_len:])
+        parent = os.path.dirname(target)
+        if parent not in made_dirs:
+            os.makedirs(parent, exist_ok=True)
+            made_dirs.add(parent)
+        pairs.append((Path(path), Path(target)))
+    _move_all(pairs)
+
+    # Remove empty subdirectories from staging (bottom-up, scandir-based walk)
+    for dirpath, _, _ in os.walk(staging, topdown=False):
+        if dirpath != str(staging):
             try:
-                path.rmdir()  # Only removes if empty
+                os.rmdir(dirpath)  # Only removes if empty
             except OSError:
                 pass  # Directory not empty, skip
 
-    return dest_dir
+    # Emptiness is a single-entry probe; only a non-empty staging folder (rare)
+    # is walked again to count what was left behind
+    with os.scandir(staging) as it:
+        leftover = next(it, None)
+    remaining = 0
+    if leftover is not None:
+        remaining = sum(1 for _ in _scandir_recursive(staging))
+    return dest_dir, len(pairs), remaining
 
 
 def format_time(seconds: float) -> str:
@@ -351,6 +652,153 @@ def format_time(seconds: float) -> str:
         return f"{hours}h {minutes}m"
 
 
+def finish_run(batch_num: int, processed_count: int, start_time: float) -> None:
+    """Print the final summary and clear progress after a complete run."""
+    elapsed = time.time() - start_time
+    print("\n" + "=" * 70)
+    print("All files processed successfully!")
+    print(f"Total batches: {batch_num}")
+    print(f"Total files processed: {processed_count}")
+    print(f"Total time: {format_time(elapsed)}")
+    print("=" * 70)
+
+    # Clear progress on successful completion
+    if PROGRESS_FILE.exists() or PROGRESS_JOURNAL.exists():
+        clear_progress()
+        print("Progress file cleared.")
+
+
+def upload_batch(
+    batch_files: list[tuple[Path, os.stat_result]],
+    staging: Path,
+    args: argparse.Namespace,
+    leftover_staged: list[str],
+) -> tuple[list[str], Path]:
+    """
+    Stage (path mode), upload and archive one batch; used by the
+    --parallel-batches workers, each with its own staging folder.
+
+    Returns:
+        Tuple of (source paths processed, archive directory)
+    """
+    files = [f for f, _ in batch_files]
+    if args.upload_mode == "stream":
+        call_api(
+            args.api_url,
+            args.api_timeout,
+            args.max_retries,
+            args.retry_delay,
+            files=files,
+        )
+        archived_dir, moved = archive_from_source(files)
+        return [str(f) for f in files[: len(moved)]], archived_dir
+
+    staged_files = move_files(files, staging)
+    call_api(
+        args.api_url,
+        args.api_timeout,
+        args.max_retries,
+        args.retry_delay,
+        staged=leftover_staged + [f.name for f in staged_files],
+        folder_path=_api_folder_path(staging),
+    )
+    archived_dir, _, remaining_count = archive_all_from_staging(staging)
+    if remaining_count:
+        print(f"⚠ Warning: {remaining_count} files still remain in {staging}!")
+    return [str(f) for f in files[: len(staged_files)]], archived_dir
+
+
+def run_parallel_batches(
+    source_files: Iterator[tuple[Path, os.stat_result]],
+    args: argparse.Namespace,
+    progress: dict,
+    batch_num: int,
+    processed_count: int,
+    start_time: float,
+) -> None:
+    """
+    Keep up to args.parallel_batches batches in flight at once.
+
+    Each in-flight batch owns one staging folder (staging_dir(slot)), so the
+    server ingests separate folders concurrently. Workers are threads: each
+    spends its time blocked on file moves or the HTTP response. Progress is
+    only updated here, on the main thread, as batches complete (possibly out
+    of order).
+    """
+    free_slots = deque(range(args.parallel_batches))
+    # Files an interrupted run left in each staging folder go out with that
+    # folder's next batch
+    leftovers = (
+        {}
+        if args.upload_mode == "stream"
+        else {slot: list_staged_files(staging_dir(slot)) for slot in free_slots}
+    )
+    running = {}
+    exhausted = False
+    failed = []
+
+    with ThreadPoolExecutor(max_workers=args.parallel_batches) as pool:
+        while True:
+            while free_slots and not exhausted and not failed:
+                raw_batch = take_batch(source_files, args.batch_size)
+                if not raw_batch:
+                    exhausted = True
+                    break
+                batch_files, missing_names = check_batch(raw_batch)
+                for name in missing_names:
+                    print(f"  ⚠ Warning: File invalid or missing, skipping: {name}")
+                if not batch_files:
+                    continue
+
+                slot = free_slots.popleft()
+                batch_num += 1
+                print(
+                    f"\nBatch {batch_num}: {len(batch_files)} files "
+                    f"({sum(size_mb(st) for _, st in batch_files):.2f} MB) "
+                    f"via {staging_dir(slot).name}"
+                )
+                future = pool.submit(
+                    upload_batch,
+                    batch_files,
+                    staging_dir(slot),
+                    args,
+                    leftovers.pop(slot, []),
+                )
+                running[future] = (slot, batch_num)
+
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                slot, num = running.pop(future)
+                try:
+                    new_files, archived_dir = future.result()
+                except Exception as exc:
+                    print(f"\n✗ Batch {num} failed: {exc}")
+                    failed.append((num, staging_dir(slot)))
+                    continue
+                free_slots.append(slot)
+                progress["processed_files"].update(new_files)
+                processed_count += len(new_files)
+                progress["batches_completed"] += 1
+                save_progress(progress, new_files)
+                print(
+                    f"✓ Batch {num} archived to: {archived_dir} "
+                    f"({processed_count}/{progress['total_files']} files)"
+                )
+
+    if failed:
+        for num, staging in failed:
+            if args.upload_mode == "stream":
+                print(f"Batch {num}: files remain in the source folder.")
+            else:
+                print(f"Batch {num}: files remain in staging folder: {staging}")
+        print("\nProgress saved. Run with --resume to continue.")
+        sys.exit(1)
+
+    finish_run(batch_num, processed_count, start_time)
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Optimized batch uploader for ghavanin files"
@@ -358,14 +806,42 @@ def main():
     parser.add_argument(
         "--batch-size",
         type=int,
-        default=DEFAULT_BATCH_SIZE,
-        help=f"Number of files to process per batch (default: {DEFAULT_BATCH_SIZE})",
+        default=None,
+        help=f"Number of files to process per batch (default: {DEFAULT_BATCH_SIZE}, "
+        "or the size chosen by --auto-tune when resuming)",
+    )
+    parser.add_argument(
+        "--auto-tune",
+        type=int,
+        nargs="?",
+        const=sum(AUTOTUNE_SIZES),
+        default=None,
+        metavar="N",
+        help="Process the first N files (default: %(const)s) as one batch per "
+        f"size in {AUTOTUNE_SIZES}, then continue with the size that was "
+        "fastest per file",
+    )
+    parser.add_argument(
+        "--parallel-batches",
+        type=int,
+        default=1,
+        metavar="K",
+        help="Number of batches in flight at once, each with its own staging "
+        "folder (default: 1)",
+    )
+    parser.add_argument(
+        "--upload-mode",
+        choices=("path", "stream"),
+        default="path",
+        help="path: stage files and send the folder path to the API; "
+        "stream: upload the files directly as multipart (default: path)",
     )
     parser.add_argument(
         "--api-url",
         type=str,
-        default=DEFAULT_API_URL,
-        help=f"API endpoint URL (default: {DEFAULT_API_URL})",
+        default=None,
+        help=f"API endpoint URL (default: {DEFAULT_API_URL}, "
+        f"or {DEFAULT_STREAM_URL} with --upload-mode stream)",
     )
     parser.add_argument(
         "--api-timeout",
@@ -383,7 +859,7 @@ def main():
         "--retry-delay",
         type=int,
         default=DEFAULT_RETRY_DELAY,
-        help=f"Delay between retries in seconds (default: {DEFAULT_RETRY_DELAY})",
+        help=f"Delay before the first retry in seconds, doubled after each failure (default: {DEFAULT_RETRY_DELAY})",
     )
     parser.add_argument(
         "--resume",
@@ -397,15 +873,26 @@ def main():
     )
 
     args = parser.parse_args()
+    if args.parallel_batches < 1:
+        parser.error("--parallel-batches must be at least 1")
+    if args.parallel_batches > 1 and args.auto_tune is not None:
+        parser.error(
+            "--auto-tune times batches one at a time; "
+            "it cannot be combined with --parallel-batches"
+        )
+    stream_mode = args.upload_mode == "stream"
+    if args.api_url is None:
+        args.api_url = DEFAULT_STREAM_URL if stream_mode else DEFAULT_API_URL
 
     # Load or reset progress
     if args.reset:
         progress = {
-            "processed_files": [],
+            "processed_files": set(),
             "total_files": 0,
             "batches_completed": 0,
             "last_update": None,
         }
+        clear_progress()
         print("Progress reset. Starting from beginning.")
     else:
         progress = load_progress()
@@ -414,14 +901,50 @@ def main():
                 f"Resuming: {len(progress['processed_files'])} files already processed."
             )
         else:
-            progress["processed_files"] = []
+            progress["processed_files"] = set()
+            progress.pop("batch_size", None)
+            # A fresh run starts a new journal
+            if PROGRESS_JOURNAL.exists():
+                PROGRESS_JOURNAL.unlink()
+
+    ensure_dirs(args.parallel_batches)
+
+    # Files left in staging by an interrupted run are still archived with the
+    # next batch, so they are named in its file list too (the only staging
+    # scan; afterwards the list is known from the moves)
+    leftover_staged = [] if stream_mode else list_staged_files()
+
+    # Files are streamed from the source tree batch by batch; only the count
+    # is taken up front (a listing-only scan) for progress reporting
+    processed_set = (
+        frozenset(progress["processed_files"]) if args.resume else frozenset()
+    )
 
-    ensure_dirs()
+    # Sizes still to be tried by the auto-tune sweep, and seconds per file
+    # measured for each; the sweep batches are real batches, not a dry run
+    tune_sizes: deque[int] = deque()
+    tune_timings: dict[int, float] = {}
+    if args.auto_tune is not None:
+        budget = args.auto_tune
+        for size in AUTOTUNE_SIZES:
+            if size > budget:
+                break
+            tune_sizes.append(size)
+            budget -= size
+        if not tune_sizes:
+            print(
+                f"Warning: --auto-tune needs at least {AUTOTUNE_SIZES[0]} files; "
+                "skipping the sweep."
+            )
+    if args.batch_size is None:
+        args.batch_size = (
+            progress.get("batch_size") if args.resume else None
+        ) or DEFAULT_BATCH_SIZE
 
-    # Get all files to process
-    processed_set = set(progress["processed_files"]) if args.resume else set()
-    all_files = list(iter_source_files(processed_set))
-    total_files = len(all_files)
+    # Progress files from older versions stored bare file names, not paths
+    legacy_format = any(not os.path.isabs(p) for p in processed_set)
+    total_files = count_source_files(processed_set, legacy_format)
+    source_files = iter_source_files(processed_set, legacy_format)
 
     if total_files == 0:
         print("No files found to process.")
@@ -440,34 +963,59 @@ def main():
     if processed_set:
         print(f"Already processed: {len(processed_set)}")
         print(f"Total files (including processed): {progress['total_files']}")
-    print(f"Batch size: {args.batch_size}")
+    if tune_sizes:
+        print(f"Auto-tune batch sizes: {tune_sizes}, then the fastest")
+    else:
+        print(f"Batch size: {args.batch_size}")
     print(
         f"Estimated batches: {(total_files + args.batch_size - 1) // args.batch_size}"
     )
+    print(f"Upload mode: {args.upload_mode}")
     print(f"API URL: {args.api_url}")
     print(f"API timeout: {args.api_timeout}s ({args.api_timeout // 60} minutes)")
     print(f"Max retries: {args.max_retries}")
+    if args.parallel_batches > 1:
+        print(f"Parallel batches: {args.parallel_batches}")
     print("-" * 70)
 
     batch_num = progress.get("batches_completed", 0)
     processed_count = len(processed_set)
     start_time = time.time()
 
+    if args.parallel_batches > 1:
+        run_parallel_batches(
+            source_files, args, progress, batch_num, processed_count, start_time
+        )
+        return
+
+    # The API call runs on this worker so the main thread can validate the
+    # next batch while the server is busy with the current one
+    api_pool = ThreadPoolExecutor(max_workers=1)
+    prefetched = None
+    next_batch = None
+    next_trial_size = None
+
     while True:
-        batch_files = take_batch(all_files, args.batch_size)
+        if tune_timings and not tune_sizes and next_batch is None:
+            # Sweep finished: continue with the fastest size per file
+            args.batch_size = min(tune_timings, key=tune_timings.get)
+            progress["batch_size"] = args.batch_size
+            save_progress(progress)  # so --resume keeps the tuned size
+            print("\nAuto-tune results (seconds per file):")
+            for size, per_file in tune_timings.items():
+                print(f"  {size:>3}: {per_file:.2f}s")
+            print(f"Using batch size {args.batch_size}")
+            tune_timings = {}
+
+        if next_batch is None:
+            trial_size = tune_sizes.popleft() if tune_sizes else None
+            batch_files = take_batch(source_files, trial_size or args.batch_size)
+        else:
+            batch_files, next_batch = next_batch, None
+            trial_size = next_trial_size
         if not batch_files:
-            elapsed = time.time() - start_time
-            print("\n" + "=" * 70)
-            print("All files processed successfully!")
-            print(f"Total batches: {batch_num}")
-            print(f"Total files processed: {processed_count}")
-            print(f"Total time: {format_time(elapsed)}")
-            print("=" * 70)
-
-            # Clear progress on successful completion
-            if PROGRESS_FILE.exists():
-                PROGRESS_FILE.unlink()
-                print("Progress file cleared.")
+            api_pool.shutdown()
+            finish_run(batch_num, processed_count, start_time)
             break
 
         batch_num += 1
@@ -479,17 +1027,16 @@ def main():
         )
 
         # Calculate and display batch size info
-        batch_size_mb = sum(get_file_size_mb(f) for f in batch_files)
+        batch_size_mb = sum(size_mb(st) for _, st in batch_files)
         print(f"Batch size: {batch_size_mb:.2f} MB")
         print("-" * 70)
 
-        # Filter out files that don't exist or are invalid
-        existing_files = []
-        for f in batch_files:
-            if f.exists() and f.is_file():
-                existing_files.append(f)
-            else:
-                print(f"  ⚠ Warning: File invalid or missing, skipping: {f.name}")
+        # Filter out files that don't exist or are invalid (already done
+        # while the previous batch was uploading, if there was one)
+        existing_files, missing_names = prefetched or check_batch(batch_files)
+        prefetched = None
+        for name in missing_names:
+            print(f"  ⚠ Warning: File invalid or missing, skipping: {name}")
 
         if len(existing_files) < len(batch_files):
             missing_count = len(batch_files) - len(existing_files)
@@ -500,69 +1047,89 @@ def main():
 
         if not batch_files:
             print("  No valid files in this batch, skipping...")
-            # Remove from all_files list
-            all_files = all_files[args.batch_size :]
             continue
 
+        batch_start = time.monotonic()
+
         # Show file names being processed
         print("Files in this batch:")
-        for i, f in enumerate(batch_files[:5], 1):  # Show first 5
-            size_mb = get_file_size_mb(f)
-            print(f"  {i}. {f.name} ({size_mb:.2f} MB)")
+        for i, (f, st) in enumerate(batch_files[:5], 1):  # Show first 5
+            print(f"  {i}. {f.name} ({size_mb(st):.2f} MB)")
         if len(batch_files) > 5:
             print(f"  ... and {len(batch_files) - 5} more files")
 
-        print(f"\nMoving files to staging: {STAGING_DIR}")
-        try:
-            staged_files = move_files(batch_files, STAGING_DIR)
-            print(f"✓ Moved {len(staged_files)} files to staging")
-        except Exception as e:
-            print(f"\n✗ Failed to move files to staging: {e}")
-            print("Stopping batch processing.")
-            sys.exit(1)
+        upload_files = None
+        if stream_mode:
+            upload_files = [f for f, _ in batch_files]
+        else:
+            print(f"\nMoving files to staging: {STAGING_DIR}")
+            try:
+                staged_files = move_files([f for f, _ in batch_files], STAGING_DIR)
+                print(f"✓ Moved {len(staged_files)} files to staging")
+                staged_names = leftover_staged + [f.name for f in staged_files]
+            except Exception as e:
+                print(f"\n✗ Failed to move files to staging: {e}")
+                print("Stopping batch processing.")
+                sys.exit(1)
 
         print(f"\nCalling API: {args.api_url}")
         try:
-            result = call_api(
+            future = api_pool.submit(
+                call_api,
                 args.api_url,
                 args.api_timeout,
                 args.max_retries,
                 args.retry_delay,
+                files=upload_files,
+                staged=None if stream_mode else staged_names,
             )
+            # Overlap: read and check the next batch's files while waiting on
+            # the API (except after the last auto-tune batch, whose timing
+            # decides the next batch's size)
+            if tune_sizes or trial_size is None:
+                next_trial_size = tune_sizes.popleft() if tune_sizes else None
+                next_batch = take_batch(
+                    source_files, next_trial_size or args.batch_size
+                )
+                prefetched = check_batch(next_batch)
+            result = future.result()
             print(f"\n✓ API Success!")
             print(f"  Files processed: {result.get('files_processed', 'N/A')}")
             print(f"  Chunks added: {result.get('chunks_added', 'N/A')}")
 
-            # Count files before archiving
-            files_before_archive = sum(1 for p in STAGING_DIR.rglob("*") if p.is_file())
-
-            print(f"\nArchiving all files from staging folder (batch {batch_num})...")
-            archived_dir = archive_all_from_staging()
-
-            # Verify staging folder is empty
-            remaining_files = list(STAGING_DIR.rglob("*"))
-            remaining_files = [p for p in remaining_files if p.is_file()]
-
-            if remaining_files:
-                print(
-                    f"⚠ Warning: {len(remaining_files)} files still remain in staging folder!"
-                )
+            if stream_mode:
+                print(f"\nArchiving uploaded files (batch {batch_num})...")
+                archived_dir, staged_files = archive_from_source(upload_files)
+                print(f"✓ Archived {len(staged_files)} files")
             else:
-                print(
-                    f"✓ All {files_before_archive} files archived. Staging folder is now empty."
+                print(f"\nArchiving all files from staging folder (batch {batch_num})...")
+                archived_dir, archived_count, remaining_count = (
+                    archive_all_from_staging()
                 )
 
+                leftover_staged = list_staged_files() if remaining_count else []
+                if remaining_count:
+                    print(
+                        f"⚠ Warning: {remaining_count} files still remain in staging folder!"
+                    )
+                else:
+                    print(
+                        f"✓ All {archived_count} files archived. Staging folder is now empty."
+                    )
+
             # Update progress - only track files that were successfully moved
             # Use the number of staged files as the actual count
             files_actually_processed = len(staged_files)
-            for f in batch_files[:files_actually_processed]:
-                progress["processed_files"].append(str(f))
+            new_files = [str(f) for f, _ in batch_files[:files_actually_processed]]
+            progress["processed_files"].update(new_files)
             processed_count += files_actually_processed
             progress["batches_completed"] = batch_num
-            save_progress(progress)
+            save_progress(progress, new_files)
 
-            # Remove processed files from the list
-            all_files = all_files[len(batch_files) :]
+            if trial_size is not None and files_actually_processed:
+                tune_timings[trial_size] = (
+                    time.monotonic() - batch_start
+                ) / files_actually_processed
 
             print(f"✓ Batch {batch_num} archived to: {archived_dir}")
 
@@ -576,7 +1143,10 @@ def main():
 
         except Exception as exc:
             print(f"\n✗ API call failed for batch {batch_num}: {exc}")
-            print(f"Files remain in staging folder: {STAGING_DIR}")
+            if stream_mode:
+                print("Files remain in the source folder.")
+            else:
+                print(f"Files remain in staging folder: {STAGING_DIR}")
             print("You can:")
             print("  1. Check the API server status")
             print("  2. Manually retry the API call")
@@ -0,0 +1,89 @@
+"""
+Pre-download Hugging Face models into the local cache.
+
+Run at image build time so the first request does not block on a Hub
+download; at runtime HuggingFaceEmbeddings / the reranker resolve from disk.
+
+Run:
+    python scripts/prefetch_model.py [model_name ...]
+
+Without arguments, EMBEDDING_MODEL (and RERANKER_MODEL when reranking is
+enabled) from app.core.config are downloaded.
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Parallel range requests when hf_transfer is installed (must be set before
+# huggingface_hub is imported)
+if importlib.util.find_spec("hf_transfer") is not None:
+    os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1")
+
+from huggingface_hub import list_repo_files, snapshot_download  # noqa: E402
+
+from app.core.config import (  # noqa: E402
+    EMBEDDING_INT8_ONNX,
+    EMBEDDING_MODEL,
+    RERANKER_ENABLED,
+    RERANKER_MODEL,
+)
+
+MAX_RETRIES = 5
+RETRY_DELAY = 5  # seconds, doubled after each failed attempt
+
+# Weight formats the runtime never loads (TensorFlow, Flax, Rust, OpenVINO,
+# ONNX exports)
+IGNORE_PATTERNS = ["*.h5", "*.msgpack", "*.ot", "openvino/*", "onnx/*"]
+
+
+def ignore_patterns(model_name: str) -> list[str]:
+    """Files of model_name that the runtime does not load."""
+    files = list_repo_files(model_name)
+    patterns = list(IGNORE_PATTERNS)
+    if any(f.endswith(".safetensors") for f in files):
+        # PyTorch loads the safetensors weights when both formats exist
+        patterns.append("*.bin")
+    if EMBEDDING_INT8_ONNX and model_name == EMBEDDING_MODEL:
+        # The int8 export starts from the plain ONNX graph; skip its variants
+        patterns.remove("onnx/*")
+        patterns.append("onnx/model_*")
+    return patterns
+
+
+def prefetch(model_name: str) -> str:
+    """Download a model snapshot with retries; returns the local path."""
+    delay = RETRY_DELAY
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            print(f"Downloading {model_name} (attempt {attempt}/{MAX_RETRIES})...")
+            path = snapshot_download(
+                model_name, ignore_patterns=ignore_patterns(model_name)
+            )
+            print(f"✓ {model_name} cached at {path}")
+            return path
+        except (OSError, ConnectionError) as e:
+            # huggingface_hub / requests connection errors derive from OSError
+            if attempt == MAX_RETRIES:
+                raise
+            print(f"  Download failed: {e}. Retrying in {delay} seconds...")
+            time.sleep(delay)
+            delay *= 2
+
+
+def main() -> None:
+    models = sys.argv[1:] or [EMBEDDING_MODEL]
+    if not sys.argv[1:] and RERANKER_ENABLED:
+        models.append(RERANKER_MODEL)
+    for model_name in models:
+        prefetch(model_name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""Shared test setup."""
+
+import os
+import shutil
+import tempfile
+
+# Set before app.core.config is imported so no test writes to storage/chroma
+_CHROMA_TEST_DIR = tempfile.mkdtemp(prefix="chroma-test-")
+os.environ["CHROMA_DB_DIR"] = _CHROMA_TEST_DIR
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_CHROMA_TEST_DIR, ignore_errors=True)
@@ -40,3 +40,11 @@ def test_cache_rag_result():
 
 
 
+def test_question_hash():
+    """Test that question hashes are stable and compact."""
+    from app.core.cache import question_hash
+
+    h = question_hash("سوال تست")
+    assert h == question_hash("سوال تست")
+    assert h != question_hash("سوال دیگر")
+    assert len(h) == 32
@@ -0,0 +1,17 @@
+"""Tests for folder ingestion."""
+
+from app.services.folder_ingestion import _listed_word_files
+
+
+def test_listed_word_files_skips_scan_and_filters(tmp_path):
+    """Test that only listed Word files inside the folder are returned."""
+    folder = tmp_path / "staging"
+    (folder / "sub").mkdir(parents=True)
+    for name in ("a.docx", "sub/b.doc", "c.txt", "unlisted.docx"):
+        (folder / name).write_bytes(b"x")
+    (tmp_path / "outside.docx").write_bytes(b"x")
+
+    files = _listed_word_files(
+        folder, ["a.docx", "sub/b.doc", "c.txt", "missing.docx", "../outside.docx"]
+    )
+    assert files == [folder / "a.docx", folder / "sub" / "b.doc"]
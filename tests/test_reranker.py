@@ -0,0 +1,86 @@
+"""Tests for document re-ranking."""
+
+import pytest
+from langchain_core.documents import Document
+
+import app.services.reranker as reranker
+
+torch = pytest.importorskip("torch")
+
+
+class _Encoded(dict):
+    def to(self, device):
+        return self
+
+
+class _StubTokenizer:
+    def __call__(self, queries, texts, **kwargs):
+        return _Encoded(texts=texts)
+
+
+class _StubModel:
+    """Returns a fixed single-label logit per document text."""
+
+    device = "cpu"
+
+    def __init__(self, scores: dict[str, float]):
+        self.scores = scores
+
+    def __call__(self, texts):
+        logits = torch.tensor([[self.scores[t]] for t in texts])
+        return type("Output", (), {"logits": logits})()
+
+
+@pytest.fixture
+def stub_reranker(monkeypatch):
+    scores = {"a": 0.1, "b": 2.0, "c": -1.0, "d": 1.5, "e": 0.7}
+    monkeypatch.setattr(reranker, "RERANKER_ENABLED", True)
+    monkeypatch.setattr(reranker, "_reranker_tokenizer", _StubTokenizer())
+    monkeypatch.setattr(reranker, "_reranker_model", _StubModel(scores))
+    return [Document(page_content=text) for text in scores]
+
+
+def _contents(docs):
+    return [d.page_content for d in docs]
+
+
+def test_rerank_top_k_smaller_than_n(stub_reranker):
+    """Test the partial selection path returns the best docs in order."""
+    reranked = reranker.rerank_documents("q", stub_reranker, top_k=3)
+    assert _contents(reranked) == ["b", "d", "e"]
+
+
+@pytest.mark.parametrize("top_k", [None, 5, 10])
+def test_rerank_full_sort(stub_reranker, top_k):
+    """Test the full sort path when top_k is None or >= number of docs."""
+    reranked = reranker.rerank_documents("q", stub_reranker, top_k=top_k)
+    assert _contents(reranked) == ["b", "d", "e", "a", "c"]
+
+
+def test_rerank_single_document(stub_reranker):
+    """Test that a single document is returned unchanged."""
+    reranked = reranker.rerank_documents("q", stub_reranker[:1], top_k=1)
+    assert _contents(reranked) == ["a"]
+
+
+def test_reranker_disabled(monkeypatch):
+    """Test that no model is returned when reranking is disabled."""
+    monkeypatch.setattr(reranker, "RERANKER_ENABLED", False)
+    assert reranker.get_reranker_model() is None
+
+
+def test_reranker_load_backoff(monkeypatch):
+    """Test that a recent load failure suppresses immediate retries."""
+    import time
+
+    monkeypatch.setattr(reranker, "_reranker_model", None)
+    monkeypatch.setattr(reranker, "_reranker_loading_attempted", False)
+    monkeypatch.setattr(reranker, "_reranker_last_failure", time.monotonic())
+    assert not reranker._should_load()
+
+    monkeypatch.setattr(
+        reranker,
+        "_reranker_last_failure",
+        time.monotonic() - reranker.RERANKER_RETRY_INTERVAL - 1,
+    )
+    assert reranker._should_load()
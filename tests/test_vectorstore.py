@@ -0,0 +1,293 @@
+"""Tests for vector store helpers."""
+
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+
+import app.services.vectorstore as vectorstore
+
+
+class _StubChroma:
+    def __init__(self, client, collection_name, embedding_function, persist_directory):
+        self.client = client
+        self.collection_name = collection_name
+
+
+@pytest.fixture
+def stub_chroma(monkeypatch):
+    monkeypatch.setattr(vectorstore, "Chroma", _StubChroma)
+    monkeypatch.setattr(vectorstore, "get_embeddings", lambda: object())
+    monkeypatch.setattr(vectorstore, "_CHROMA_CLIENT", object())
+    vectorstore.reset_cache()
+    yield
+    vectorstore.reset_cache()
+
+
+def test_get_vectorstore_is_cached_per_collection(stub_chroma):
+    """Test that Chroma handles are reused until the cache is reset."""
+    vs = vectorstore.get_vectorstore("a")
+    assert vectorstore.get_vectorstore("a") is vs
+    assert vectorstore.get_vectorstore("b") is not vs
+
+    vectorstore.reset_cache("a")
+    assert vectorstore.get_vectorstore("a") is not vs
+    # Every handle shares the one process-wide client
+    assert vectorstore.get_vectorstore("b").client is vs.client
+
+
+class _StubVectorStore:
+    """Minimal stand-in exposing a real in-memory Chroma collection."""
+
+    def __init__(self, name="test-collection"):
+        import chromadb
+
+        client = chromadb.EphemeralClient()
+        try:
+            client.delete_collection(name)
+        except Exception:
+            pass
+        self._collection = client.create_collection(name)
+
+    def persist(self):
+        pass
+
+
+@pytest.fixture
+def stub_store(monkeypatch):
+    import numpy as np
+
+    vs = _StubVectorStore()
+    monkeypatch.setattr(vectorstore, "get_vectorstore", lambda *a, **kw: vs)
+    monkeypatch.setattr(
+        vectorstore,
+        "_embed_texts",
+        lambda texts: np.array([[len(t), 1.0] for t in texts], dtype=np.float32),
+    )
+    return vs
+
+
+def test_add_documents_uses_content_ids(stub_store):
+    """Test that identical texts collapse to one id and re-ingest is idempotent."""
+    docs = [
+        Document(page_content="ماده ۱", metadata={"source": "a.pdf"}),
+        Document(page_content="ماده ۲", metadata={"source": "a.pdf"}),
+        Document(page_content="ماده ۱", metadata={"source": "a.pdf"}),
+    ]
+
+    assert vectorstore.add_documents(docs) == 2
+    # Already stored texts are skipped before embedding
+    assert vectorstore.add_documents(docs) == 0
+    assert stub_store._collection.count() == 2
+
+    stored = stub_store._collection.get(ids=[vectorstore._document_id(docs[1])])
+    assert stored["documents"] == ["ماده ۲"]
+    assert stored["metadatas"] == [{"source": "a.pdf"}]
+
+
+def test_same_text_from_another_source_is_kept(stub_store, monkeypatch, tmp_path):
+    """Test that boilerplate shared by two laws is stored once per source."""
+    monkeypatch.setattr(vectorstore, "PERSIST_DIRECTORY", str(tmp_path))
+    text = "این قانون از تاریخ تصویب لازم‌الاجرا است"
+    docs = [
+        Document(page_content=text, metadata={"source": s}) for s in ("a.pdf", "b.pdf")
+    ]
+
+    assert vectorstore.add_documents(docs) == 2
+    assert vectorstore.add_documents(docs[1:]) == 0
+    assert vectorstore.get_stored_sources() == {"a.pdf": 1, "b.pdf": 1}
+
+
+def test_ingest_batches_pipeline(stub_store):
+    """Test that all batches flow through the encoder/writer pipeline."""
+    docs = [Document(page_content=f"متن {i}") for i in range(7)]
+
+    added, batches = vectorstore._ingest_batches(stub_store, docs, batch_size=2)
+    assert (added, batches) == (7, 4)
+    assert stub_store._collection.count() == 7
+
+
+def test_ingest_batches_propagates_encoder_errors(stub_store, monkeypatch):
+    """Test that a failure in the encoder thread is raised to the caller."""
+    def _fail(texts):
+        raise RuntimeError("encoder failed")
+
+    monkeypatch.setattr(vectorstore, "_embed_texts", _fail)
+    docs = [Document(page_content=f"متن {i}") for i in range(3)]
+
+    with pytest.raises(RuntimeError, match="encoder failed"):
+        vectorstore._ingest_batches(stub_store, docs, batch_size=1)
+
+
+def test_ingest_batches_persists_on_checkpoints(stub_store, monkeypatch):
+    """Test that persist runs every CHROMA_PERSIST_EVERY batches plus once at the end."""
+    calls = []
+    monkeypatch.setattr(stub_store, "persist", lambda: calls.append(1), raising=False)
+    monkeypatch.setattr(vectorstore, "CHROMA_PERSIST_EVERY", 2)
+    docs = [Document(page_content=f"متن {i}") for i in range(5)]
+
+    vectorstore._ingest_batches(stub_store, docs, batch_size=1)
+    # checkpoints after batches 2 and 4, plus the final flush
+    assert len(calls) == 3
+
+
+def test_autotune_batch_size_caches_winner(stub_store, monkeypatch, tmp_path):
+    """Test that autotune times only inserts, stores its sample once and
+    caches the chosen size per collection."""
+    import chromadb
+
+    monkeypatch.setattr(vectorstore, "_AUTOTUNE_SIZES", (2, 3))
+    monkeypatch.setattr(vectorstore, "_AUTOTUNE_FILE", tmp_path / "tuning.json")
+    monkeypatch.setattr(vectorstore, "_CHROMA_CLIENT", chromadb.EphemeralClient())
+    embedded = []
+    embed = vectorstore._embed_texts
+    monkeypatch.setattr(
+        vectorstore, "_embed_texts", lambda texts: embedded.append(texts) or embed(texts)
+    )
+    docs = [Document(page_content=f"متن {i}") for i in range(8)]
+
+    size, consumed, added = vectorstore._autotune_batch_size(stub_store, docs)
+    assert size in (2, 3)
+    assert (consumed, added) == (3, 3)
+    # The sample is embedded once, however many timed runs there are
+    assert len(embedded) == 1
+    assert stub_store._collection.count() == 3
+    assert "autotune-scratch" not in [
+        c.name for c in vectorstore.get_chroma_client().list_collections()
+    ]
+
+    # Second call reuses the cached size without inserting anything
+    assert vectorstore._autotune_batch_size(stub_store, docs) == (size, 0, 0)
+    # ... but only for the collection it was measured on
+    other = SimpleNamespace(_collection=SimpleNamespace(name="other"))
+    assert vectorstore._autotune_batch_size(other, docs[:1]) == (
+        vectorstore.CHROMA_BATCH_SIZE,
+        0,
+        0,
+    )
+
+
+def test_add_documents_autotune_skips_stored(stub_store, monkeypatch, tmp_path):
+    """Test that documents already stored are not re-added by the autotune probe."""
+    import chromadb
+
+    monkeypatch.setattr(vectorstore, "_AUTOTUNE_SIZES", (2, 3))
+    monkeypatch.setattr(vectorstore, "_AUTOTUNE_FILE", tmp_path / "tuning.json")
+    monkeypatch.setattr(vectorstore, "_CHROMA_CLIENT", chromadb.EphemeralClient())
+    monkeypatch.setattr(vectorstore, "CHROMA_AUTOTUNE_BATCH", True)
+    docs = [
+        Document(page_content=f"متن {i}", metadata={"source": "a"}) for i in range(6)
+    ]
+
+    assert vectorstore.add_documents(docs[:2]) == 2
+    assert vectorstore.add_documents(docs) == 4
+    assert stub_store._collection.count() == 6
+
+
+def test_count_sources_sql(monkeypatch, tmp_path):
+    """Test that the SQLite GROUP BY counts chunks per source for one collection."""
+    import chromadb
+
+    client = chromadb.PersistentClient(path=str(tmp_path))
+    collection = client.create_collection("legal-texts")
+    other = client.create_collection("other-texts")
+    collection.add(
+        ids=["1", "2", "3", "4"],
+        documents=["x", "y", "z", "w"],
+        metadatas=[{"source": "a.pdf"}, {"source": "a.pdf"}, {"source": "b.pdf"}, None],
+        embeddings=[[1.0, 0.0]] * 4,
+    )
+    other.add(
+        ids=["1"], documents=["x"], metadatas=[{"source": "c.pdf"}], embeddings=[[1.0, 0.0]]
+    )
+    monkeypatch.setattr(vectorstore, "PERSIST_DIRECTORY", str(tmp_path))
+
+    assert vectorstore._count_sources_sql(collection) == {"a.pdf": 2, "b.pdf": 1}
+
+
+def test_count_sources_sql_without_database(monkeypatch, tmp_path):
+    """Test that a missing SQLite file falls back to the Python path."""
+    monkeypatch.setattr(vectorstore, "PERSIST_DIRECTORY", str(tmp_path))
+    assert vectorstore._count_sources_sql(object()) is None
+
+
+def test_get_stored_sources_pages_through_collection(stub_store, monkeypatch, tmp_path):
+    """Test the paged collection.get() fallback when SQLite is not available."""
+    monkeypatch.setattr(vectorstore, "PERSIST_DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(vectorstore, "_SOURCES_PAGE_SIZE", 2)
+    stub_store._collection.add(
+        ids=[str(i) for i in range(5)],
+        documents=["x"] * 5,
+        metadatas=[{"source": "a.pdf"}] * 3 + [{"source": "b.pdf"}, {"page": 1}],
+        embeddings=[[1.0, 0.0]] * 5,
+    )
+
+    assert vectorstore.get_stored_sources() == {"a.pdf": 3, "b.pdf": 1}
+
+
+def test_l2_normalize_in_place():
+    """Test that rows become unit length and zero rows are left untouched."""
+    import numpy as np
+
+    embeddings = np.array([[3.0, 4.0], [0.0, 0.0], [0.0, 2.0]], dtype=np.float32)
+    result = vectorstore._l2_normalize(embeddings)
+
+    assert result is embeddings
+    np.testing.assert_allclose(result, [[0.6, 0.8], [0.0, 0.0], [0.0, 1.0]])
+
+
+def test_embed_texts_matches_query_preprocessing(monkeypatch):
+    """Test that newlines are replaced before encoding, as embed_query does."""
+    import numpy as np
+
+    seen = []
+
+    class _Model:
+        def encode(self, texts, **kwargs):
+            seen.extend(texts)
+            return np.ones((len(texts), 2), dtype=np.float32)
+
+    embeddings = type("Embeddings", (), {"_client": _Model()})()
+    monkeypatch.setattr(vectorstore, "get_embeddings", lambda: embeddings)
+
+    vectorstore._embed_texts(["ماده ۱\nتبصره", "متن"])
+    assert seen == ["ماده ۱ تبصره", "متن"]
+
+
+def test_ingest_batches_groups_similar_lengths(stub_store, monkeypatch):
+    """Test that batches are formed from length-sorted documents."""
+    seen = []
+    embed = vectorstore._embed_texts
+    monkeypatch.setattr(
+        vectorstore, "_embed_texts", lambda texts: seen.append(texts) or embed(texts)
+    )
+    docs = [Document(page_content="x" * n) for n in (5, 1, 4, 2, 3, 6)]
+
+    vectorstore._ingest_batches(stub_store, docs, batch_size=2)
+    assert [[len(t) for t in batch] for batch in seen] == [[1, 2], [3, 4], [5, 6]]
+
+
+def test_clean_metadata():
+    """Test that metadata is reduced to values Chroma can store."""
+    scalars = {"source": "a.pdf", "page": 3, "score": 0.5, "ok": True}
+    assert vectorstore._clean_metadata(scalars) is scalars
+    assert vectorstore._clean_metadata({}) is None
+    assert vectorstore._clean_metadata({"x": None}) is None
+    assert vectorstore._clean_metadata(
+        {"source": "a.pdf", "tags": ["مدنی", "قرارداد"], "x": None}
+    ) == {"source": "a.pdf", "tags": '["مدنی", "قرارداد"]'}
+
+
+def test_set_search_ef(monkeypatch, tmp_path):
+    """Test that ef_search is raised without touching the build parameters."""
+    import chromadb
+
+    client = chromadb.PersistentClient(path=str(tmp_path))
+    collection = client.create_collection("legal-texts")
+    handle = type("Handle", (), {"_collection": collection})()
+    monkeypatch.setattr(vectorstore, "_CHROMA_CLIENT", client)
+    monkeypatch.setattr(vectorstore, "get_vectorstore", lambda name: handle)
+
+    hnsw = vectorstore.set_search_ef("legal-texts", ef_search=256)
+    assert hnsw["ef_search"] == 256
+    assert hnsw["ef_construction"] == 100